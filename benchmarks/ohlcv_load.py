@@ -0,0 +1,88 @@
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import click
+import numpy as np
+import pandas as pd
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+import server
+from request_pool import RequestPool
+from response_cache import ResponseCache
+from store import Store, _ohlcv_key
+
+# 同時接続数ごとの /ohlcv.parquet のレイテンシ(p50/p99)と503の数を測る
+# 取引所には接続せず、storeに1分足のダミーデータを入れ、キャッシュは無効にして計測する
+#
+# pipenv run python benchmarks/ohlcv_load.py --concurrency 1,4,16,64
+
+
+def _make_df_ohlcv(end, periods):
+    index = pd.date_range(end=end, periods=periods, freq=pd.to_timedelta(60, unit='s'), tz='UTC', name='timestamp')
+    values = np.random.rand(periods, 5)
+    return pd.DataFrame(values, index=index, columns=['op', 'hi', 'lo', 'cl', 'volume'])
+
+
+def _request(url):
+    start = time.time()
+    try:
+        with urllib.request.urlopen(url) as res:
+            res.read()
+            status = res.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.time() - start, status
+
+
+@click.command()
+@click.option('--markets', type=int, default=20, help='number of markets')
+@click.option('--days', type=int, default=30, help='history length (days)')
+@click.option('--concurrency', default='1,2,4,8,16,32', help='comma separated concurrent clients')
+@click.option('--requests', 'request_count', type=int, default=64, help='requests per concurrency')
+@click.option('--request_workers', type=int, default=16, help='request pool threads')
+@click.option('--max_requests', type=int, default=8, help='requests processed at once')
+@click.option('--max_waiting', type=int, default=32, help='waiting requests before 503')
+def main(markets, days, concurrency, request_count, request_workers, max_requests, max_waiting):
+    logger = logging.getLogger(__name__)
+    store = Store(logger=logger)
+    end = pd.Timestamp('2021-06-01', tz='UTC')
+    market_names = ['M{}'.format(i) for i in range(markets)]
+    for market in market_names:
+        store.dfs[_ohlcv_key('binance_future', market, 60, None)] = _make_df_ohlcv(end, days * 24 * 60)
+    server.store = store
+    server.response_cache = ResponseCache(max_bytes=0)
+    server.market_cache = ResponseCache(max_bytes=0)
+    server.request_pool = RequestPool(workers=request_workers, max_requests=max_requests, max_waiting=max_waiting)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/ohlcv.parquet?exchange=binance_future&markets={}&interval=60&end_time={}'.format(
+        http_server.server_port, ','.join(market_names), end.timestamp())
+
+    for n in [int(x) for x in concurrency.split(',')]:
+        start = time.time()
+        with ThreadPoolExecutor(n) as executor:
+            results = list(executor.map(lambda _: _request(url), range(max(request_count, n))))
+        elapsed = time.time() - start
+        latencies = np.array([latency for latency, status in results if status == 200])
+        rejected = sum(1 for _, status in results if status == 503)
+        print('concurrency={:>3} p50={:>7.3f}s p99={:>7.3f}s rejected={:>3} throughput={:>6.1f}req/s'.format(
+            n,
+            np.percentile(latencies, 50) if len(latencies) > 0 else float('nan'),
+            np.percentile(latencies, 99) if len(latencies) > 0 else float('nan'),
+            rejected,
+            len(results) / elapsed,
+        ))
+
+    http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
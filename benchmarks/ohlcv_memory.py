@@ -0,0 +1,67 @@
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+import server
+from store import Store, _ohlcv_key
+
+# /ohlcv.parquet 1リクエストあたりの確保メモリ(tracemallocのpeak)を測る
+# 取引所には接続せず、storeに1分足のダミーデータを入れて計測する
+#
+# pipenv run python benchmarks/ohlcv_memory.py --markets 50 --days 365
+
+
+def _make_df_ohlcv(end, periods):
+    index = pd.date_range(end=end, periods=periods, freq=pd.to_timedelta(60, unit='s'), tz='UTC', name='timestamp')
+    values = np.random.rand(periods, 5)
+    return pd.DataFrame(values, index=index, columns=['op', 'hi', 'lo', 'cl', 'volume'])
+
+
+def _measure(client, url):
+    server.response_cache.clear()
+    server.market_cache.clear()
+    tracemalloc.start()
+    start = time.time()
+    res = client.get(url)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, peak, elapsed
+
+
+@click.command()
+@click.option('--markets', type=int, default=50, help='number of markets')
+@click.option('--days', type=int, default=365, help='history length (days)')
+def main(markets, days):
+    logger = logging.getLogger(__name__)
+    store = Store(logger=logger)
+    end = pd.Timestamp('2021-06-01', tz='UTC')
+    market_names = ['M{}'.format(i) for i in range(markets)]
+    for market in market_names:
+        store.dfs[_ohlcv_key('binance_future', market, 60, None)] = _make_df_ohlcv(end, days * 24 * 60)
+    server.store = store
+    client = server.app.test_client()
+
+    end_time = end.timestamp()
+    windows = [
+        ('full', None),
+        ('30d', 30),
+        ('1d', 1),
+    ]
+    for name, window_days in windows:
+        url = '/ohlcv.parquet?exchange=binance_future&markets={}&interval=60'.format(','.join(market_names))
+        if window_days is not None:
+            url += '&start_time={}&end_time={}'.format(end_time - window_days * 86400, end_time)
+        res, peak, elapsed = _measure(client, url)
+        print('{:>5} peak_alloc={:>8.1f}MB response={:>8.1f}MB elapsed={:.2f}s'.format(
+            name, peak / 1024 / 1024, len(res.data) / 1024 / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
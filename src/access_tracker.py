@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+# /ohlcv.parquetで要求された(exchange, market)ごとの回数と最終アクセス時刻
+class AccessTracker:
+    def __init__(self):
+        self.accesses = {}
+        self.lock = threading.Lock()
+
+    def record(self, exchange, market, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            access = self.accesses.get((exchange, market))
+            if access is None:
+                access = {'count': 0, 'last_access': None}
+                self.accesses[(exchange, market)] = access
+            access['count'] += 1
+            access['last_access'] = now
+
+    def get(self, exchange, market):
+        with self.lock:
+            access = self.accesses.get((exchange, market))
+            return None if access is None else dict(access)
+
+    def status(self, limit=20):
+        with self.lock:
+            items = [(key, dict(access)) for key, access in self.accesses.items()]
+        items = sorted(items, key=lambda x: -x[1]['count'])
+        return {
+            'count': len(items),
+            'top': [
+                {
+                    'exchange': key[0],
+                    'market': key[1],
+                    'count': access['count'],
+                    'last_access': access['last_access'],
+                }
+                for key, access in items[:limit]
+            ],
+        }
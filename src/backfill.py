@@ -0,0 +1,74 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from store import GAP_MIN_BARS, Store, _parse_ohlcv_key
+
+# data_dirに保存済みの足の途中の穴を取得し直して埋める
+# サーバーが同じdata_dirに書き込んでいる間は実行しない (サーバーのメモリ上のdfで上書きされる)
+# 取引所からは最初の穴以降を全て取得し直し、それ以降のパーティションを全て書き直す
+# 古い穴があるキーは--max_gap_age_daysで最近の穴だけにする
+#
+# pipenv run python src/backfill.py --data_dir data/store --exchange bybit --dry_run
+
+
+@click.command()
+@click.option('--data_dir', required=True, help='store data dir (e.g. data/store)')
+@click.option('--start_time', type=int, default=None, help='data start time')
+@click.option('--exchange', default=None, help='only this exchange')
+@click.option('--market', default=None, help='only this market')
+@click.option('--min_gap_bars', type=int, default=GAP_MIN_BARS, help='missing bars to be a gap')
+@click.option('--max_gap_age_days', type=float, default=None,
+              help='skip gaps older than this. backfill refetches and rewrites everything after the oldest gap')
+@click.option('--memory_limit', type=int, default=1024, help='store resident memory limit (MB)')
+@click.option('--workers', type=int, default=4, help='keys backfilled at once')
+@click.option('--fetch_concurrency', type=int, default=8, help='concurrent exchange requests per exchange')
+@click.option('--dry_run', is_flag=True, help='only list gaps')
+def main(data_dir, start_time, exchange, market, min_gap_bars, max_gap_age_days, memory_limit, workers,
+         fetch_concurrency, dry_run):
+    logger = logging.getLogger('backfill')
+    logger.setLevel(level=logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+
+    store = Store(
+        logger=logger,
+        start_time=start_time,
+        data_dir=data_dir,
+        memory_limit=memory_limit * 1024 * 1024,
+        fetch_concurrency=fetch_concurrency,
+    )
+
+    targets = []
+    for key in sorted(store.stored_keys):
+        parsed = _parse_ohlcv_key(key)
+        if parsed is None:
+            continue
+        if exchange is not None and parsed[0] != exchange:
+            continue
+        if market is not None and parsed[1] != market:
+            continue
+        targets.append(parsed)
+
+    min_gap_time = None if max_gap_age_days is None else time.time() - max_gap_age_days * 24 * 60 * 60
+
+    def run(target):
+        key_exchange, key_market, interval, price_type = target
+        gaps = store.get_gaps(key_exchange, key_market, interval, price_type, min_gap_bars=min_gap_bars)
+        gaps = [x for x in gaps if min_gap_time is None or x[0] >= min_gap_time]
+        if len(gaps) == 0 or dry_run:
+            return target, gaps, []
+        filled = store.backfill(key_exchange, key_market, interval, price_type, min_gap_bars=min_gap_bars,
+                                min_gap_time=min_gap_time)
+        return target, gaps, filled
+
+    with ThreadPoolExecutor(workers) as executor:
+        for target, gaps, filled in executor.map(run, targets):
+            if len(gaps) == 0:
+                continue
+            print('{} {} interval={} price_type={} gaps={} missing_bars={} filled={}'.format(
+                target[0], target[1], target[2], target[3],
+                len(gaps), sum(x[2] for x in gaps), len(filled)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import io
+import os
+import re
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import click
+import numpy as np
+import pandas as pd
+from partitioned_storage import PartitionedStorage
+from store import _ohlcv_fetch_interval, _ohlcv_key
+
+# 取引所のアーカイブなどのファイルをdata_dirに直接書き込む (キーごとに別プロセス)
+# 取り込んだ後はサーバーを起動すれば、保存済みの最後の足から取得を続ける
+# サーバーが同じdata_dirに書き込んでいる間は実行しない
+#
+# 対応するファイル
+# - Binanceのklineアーカイブ (https://data.binance.vision/ の SYMBOL-1m-2021-01.zip とその中のcsv)
+#   ファイル名から市場と足を決める
+# - 列がtimestamp, op, hi, lo, cl, volume のcsv/parquet (timestampはepoch秒かISO 8601、UTC)
+#   --market, --intervalを指定する
+# storeは取得する足(通常は1分足)からリサンプリングするので、それ以外の足は取り込まない
+#
+# pipenv run python src/bulk_import.py --data_dir data/store --exchange binance_future data/binance/*.zip
+
+OHLCV_COLUMNS = ['op', 'hi', 'lo', 'cl', 'volume']
+
+BINANCE_KLINE_COLUMNS = [
+    'open_time', 'op', 'hi', 'lo', 'cl', 'volume', 'close_time', 'quote_volume', 'count',
+    'taker_buy_volume', 'taker_buy_quote_volume', 'ignore',
+]
+
+BINANCE_INTERVALS = {
+    '1m': 60,
+    '3m': 3 * 60,
+    '5m': 5 * 60,
+    '15m': 15 * 60,
+    '30m': 30 * 60,
+    '1h': 60 * 60,
+    '2h': 2 * 60 * 60,
+    '4h': 4 * 60 * 60,
+    '6h': 6 * 60 * 60,
+    '8h': 8 * 60 * 60,
+    '12h': 12 * 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+BINANCE_FNAME_PATTERN = re.compile(r'^([A-Z0-9]+)-(\d+[mhd])-\d{4}-\d{2}(-\d{2})?\.(zip|csv)$')
+
+
+def read_binance_klines(path):
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as z:
+            dfs = [
+                _read_binance_kline_csv(z.read(name))
+                for name in sorted(z.namelist()) if name.endswith('.csv')
+            ]
+        return pd.concat(dfs) if len(dfs) > 0 else None
+    with open(path, 'rb') as f:
+        return _read_binance_kline_csv(f.read())
+
+
+def _read_binance_kline_csv(data):
+    # 新しいアーカイブにはヘッダがある
+    header = 0 if not data[:1].isdigit() else None
+    df = pd.read_csv(io.BytesIO(data), header=header, names=BINANCE_KLINE_COLUMNS)
+    open_time = df['open_time'].astype(np.int64)
+    # spotの2025年以降はマイクロ秒
+    unit = 'us' if open_time.max() >= 10 ** 14 else 'ms'
+    df['timestamp'] = pd.to_datetime(open_time, unit=unit, utc=True)
+    return _normalize(df.set_index('timestamp'))
+
+
+def read_ohlcv_file(path):
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        if 'timestamp' in df.columns:
+            df = df.set_index('timestamp')
+    else:
+        df = pd.read_csv(path).set_index('timestamp')
+
+    if not isinstance(df.index, pd.DatetimeIndex):
+        if np.issubdtype(df.index.dtype, np.number):
+            df.index = pd.to_datetime(df.index, unit='s', utc=True)
+        else:
+            df.index = pd.to_datetime(df.index, utc=True)
+    if df.index.tz is None:
+        df.index = df.index.tz_localize('UTC')
+    df.index.name = 'timestamp'
+    return _normalize(df)
+
+
+def _normalize(df):
+    missing = [x for x in OHLCV_COLUMNS if x not in df.columns]
+    if len(missing) > 0:
+        raise ValueError('missing columns {}'.format(missing))
+    return df[OHLCV_COLUMNS].astype(np.float64)
+
+
+# 同じキーのファイルをまとめて読み、保存済みのものと合わせて保存する (保存済みの足を優先する)
+def import_key(data_dir, key, paths, binance):
+    read = read_binance_klines if binance else read_ohlcv_file
+    dfs = [read(path) for path in sorted(paths)]
+    dfs = [x for x in dfs if x is not None]
+    if len(dfs) == 0:
+        return key, 0
+
+    storage = PartitionedStorage(data_dir)
+    df_stored = storage.load(key)
+    if df_stored is not None:
+        dfs = [df_stored] + dfs
+    df = pd.concat(dfs)
+    df = df[~df.index.duplicated(keep='first')].sort_index()
+
+    count = df.shape[0] - (0 if df_stored is None else df_stored.shape[0])
+    if count > 0:
+        storage.save(key, df)
+    return key, count
+
+
+def _import_key(args):
+    return import_key(*args)
+
+
+def _list_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, fnames in os.walk(path):
+                files += [os.path.join(dirpath, x) for x in fnames]
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+# ファイルをキーごとにまとめる。storeが読まない足のアーカイブは読み飛ばす
+def group_files(paths, exchange, market=None, interval=None, price_type=None, min_interval=None):
+    if interval is not None and _ohlcv_fetch_interval(interval, min_interval) != interval:
+        raise click.UsageError('interval {} is resampled from {} bars by the store and never read'.format(
+            interval, _ohlcv_fetch_interval(interval, min_interval)))
+
+    groups = defaultdict(list)
+    binance_keys = set()
+    for path in _list_files(paths):
+        m = BINANCE_FNAME_PATTERN.match(os.path.basename(path))
+        if m is not None and m.group(2) in BINANCE_INTERVALS:
+            key_interval = BINANCE_INTERVALS[m.group(2)] if interval is None else interval
+            if _ohlcv_fetch_interval(key_interval, min_interval) != key_interval:
+                click.echo('skip {} (interval {} is resampled from {} bars by the store)'.format(
+                    path, key_interval, _ohlcv_fetch_interval(key_interval, min_interval)), err=True)
+                continue
+            key = _ohlcv_key(
+                exchange,
+                m.group(1) if market is None else market,
+                key_interval,
+                price_type,
+            )
+            binance_keys.add(key)
+        elif path.endswith('.csv') or path.endswith('.parquet'):
+            if market is None or interval is None:
+                raise click.UsageError('--market and --interval are required for {}'.format(path))
+            key = _ohlcv_key(exchange, market, interval, price_type)
+        else:
+            continue
+        groups[key].append(path)
+
+    mixed = [key for key in groups if key in binance_keys and
+             any(BINANCE_FNAME_PATTERN.match(os.path.basename(x)) is None for x in groups[key])]
+    if len(mixed) > 0:
+        raise click.UsageError('binance archives and other files are mixed in {}'.format(mixed))
+    return groups, binance_keys
+
+
+@click.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--data_dir', required=True, help='store data dir (e.g. data/store)')
+@click.option('--exchange', required=True, help='exchange of the data (e.g. binance_future)')
+@click.option('--market', default=None, help='market (default: from binance archive file name)')
+@click.option('--interval', type=int, default=None, help='interval sec (default: from binance archive file name)')
+@click.option('--price_type', default=None, help='price type (e.g. mark, index, premium_index)')
+@click.option('--min_interval', type=int, default=None, help='min interval of the server')
+@click.option('--workers', type=int, default=multiprocessing.cpu_count(), help='processes')
+def main(paths, data_dir, exchange, market, interval, price_type, min_interval, workers):
+    groups, binance_keys = group_files(paths, exchange, market, interval, price_type, min_interval)
+
+    tasks = [(data_dir, key, paths, key in binance_keys) for key, paths in sorted(groups.items())]
+    with ProcessPoolExecutor(workers) as executor:
+        for key, count in executor.map(_import_key, tasks):
+            print('{} imported={}'.format(key, count))
+
+
+if __name__ == '__main__':
+    main()
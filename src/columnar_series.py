@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from pandas.core.arrays import DatetimeArray
+
+# 追記時に確保し直す大きさ (今の大きさのGROWTH倍、少なくともMIN_CAPACITY行)
+GROWTH = 1.25
+MIN_CAPACITY = 1024
+
+
+# storeのキー1つ分の時系列 (timestampはUTCのepoch(ns)、値はすべてfloat64)
+# 列ごとに連続した配列を持ち、追記は確保済みの領域に書くだけなので、更新のたびにdf全体を作り直さない
+# to_dfはtimestampと値の配列をコピーせずに参照する
+class ColumnarSeries:
+    __slots__ = ['columns', 'timestamps', 'values', 'size']
+
+    def __init__(self, columns, capacity=0):
+        self.columns = list(columns)
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((len(self.columns), capacity), dtype=np.float64)
+        self.size = 0
+
+    # float64の列とtimestampのindexだけのdfなら使える
+    @staticmethod
+    def supports(df):
+        return (
+            df is not None
+            and isinstance(df.index, pd.DatetimeIndex)
+            and all(dtype == np.float64 for dtype in df.dtypes)
+        )
+
+    @classmethod
+    def from_df(cls, df):
+        series = cls(df.columns, capacity=df.shape[0])
+        series.update(df)
+        return series
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.values.nbytes
+
+    # dfの先頭以降をdfで置き換える
+    # size未満の行はto_dfで返したものが参照しているので書き換えない
+    # 重なる行が同じなら残りを確保済みの領域に追記し、違えば新しい領域に作り直す
+    def update(self, df):
+        if list(df.columns) != self.columns:
+            raise ValueError('columns mismatch {} {}'.format(list(df.columns), self.columns))
+
+        timestamps = _to_epoch_ns(df.index)
+        start = int(np.searchsorted(self.timestamps[:self.size], timestamps[0])) if len(timestamps) > 0 else self.size
+        overlap = min(self.size - start, len(timestamps))
+        values = np.empty((len(self.columns), len(timestamps)), dtype=np.float64)
+        for i, column in enumerate(self.columns):
+            values[i] = df[column].to_numpy(dtype=np.float64)
+
+        unchanged = (
+            overlap == self.size - start
+            and np.array_equal(self.timestamps[start:self.size], timestamps[:overlap])
+            and _values_equal(self.values[:, start:self.size], values[:, :overlap])
+        )
+        if unchanged:
+            timestamps = timestamps[overlap:]
+            values = values[:, overlap:]
+            start = self.size
+        else:
+            # dfより前の行だけ新しい領域に移す (今までの配列を参照しているものはそのまま)
+            capacity = _capacity(self.timestamps.shape[0], start + len(timestamps))
+            head_timestamps = self.timestamps[:start]
+            head_values = self.values[:, :start]
+            self.timestamps = np.empty(capacity, dtype=np.int64)
+            self.values = np.empty((len(self.columns), capacity), dtype=np.float64)
+            self.timestamps[:start] = head_timestamps
+            self.values[:, :start] = head_values
+            self.size = start
+
+        size = start + len(timestamps)
+        if size > self.timestamps.shape[0]:
+            self._reserve(_capacity(self.timestamps.shape[0], size))
+
+        # size以降は誰も参照していないので、書いてからsizeを進める
+        self.timestamps[start:size] = timestamps
+        self.values[:, start:size] = values
+        self.size = size
+
+    # 返したdfは共有されているので変更してはいけない
+    def to_df(self, start=0, end=None):
+        end = self.size if end is None else end
+        timestamps = DatetimeArray._simple_new(
+            self.timestamps[start:end].view('datetime64[ns]'), dtype=pd.DatetimeTZDtype(tz='UTC'))
+        index = pd.DatetimeIndex(timestamps, name='timestamp', copy=False)
+        return pd.DataFrame(self.values[:, start:end].T, index=index, columns=self.columns, copy=False)
+
+    def _reserve(self, capacity):
+        # 新しい領域に移すだけで、今までの配列を参照しているものはそのまま使える
+        timestamps = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(self.columns), capacity), dtype=np.float64)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        values[:, :self.size] = self.values[:, :self.size]
+        self.timestamps = timestamps
+        self.values = values
+
+
+def _to_epoch_ns(index):
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.values.astype('datetime64[ns]').view(np.int64)
+
+
+def _capacity(capacity, size):
+    if size <= capacity:
+        return capacity
+    return max(size, int(capacity * GROWTH), MIN_CAPACITY)
+
+
+def _values_equal(a, b):
+    return bool(((a == b) | (np.isnan(a) & np.isnan(b))).all())
@@ -1,3 +1,6 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import threading
 import ccxt
 from ccxt_rate_limiter import scale_limits, wrap_object
 from ccxt_rate_limiter.bybit import bybit_limits, bybit_wrap_defs
@@ -13,15 +16,84 @@ from crypto_data_fetcher.binance_spot import BinanceSpotFetcher
 from crypto_data_fetcher.okex import OkexFetcher
 from crypto_data_fetcher.kraken import KrakenFetcher
 
+CCXT_EXCHANGES = {
+    'bybit': 'bybit',
+    'ftx': 'ftx',
+    'binance_future': 'binance',
+    'binance_spot': 'binance',
+    'okex': 'okex',
+    'kraken': 'kraken',
+}
+
 
 class DataFetcherBuilder:
-    def __init__(self):
+    def __init__(self, max_idle=16):
         self.bybit_rate_limiter = RateLimiterGroup(limits=scale_limits(bybit_limits(), 0.5))
         self.ftx_rate_limiter = RateLimiterGroup(limits=scale_limits(ftx_limits(), 0.5))
         self.binance_rate_limiter = RateLimiterGroup(limits=scale_limits(binance_limits(), 0.5))
         self.okex_rate_limiter = RateLimiterGroup(limits=scale_limits(okex_limits(), 0.5))
         self.kraken_rate_limiter = RateLimiterGroup(limits=scale_limits(kraken_limits(), 0.2))
 
+        # fetcherとccxt clientは使い回す (requests.Sessionのkeep-aliveとload_marketsの結果を再利用するため)
+        self.max_idle = max_idle
+        self.pools = defaultdict(list)
+        self.pool_stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'in_use': 0})
+        self.pools_lock = threading.Lock()
+
+    @contextmanager
+    def fetcher(self, exchange=None, logger=None):
+        with self._pooled(('fetcher', exchange, logger), lambda: self.create_fetcher(exchange=exchange, logger=logger)) as fetcher:
+            yield fetcher
+
+    @contextmanager
+    def ccxt_client(self, exchange=None):
+        ccxt_exchange = CCXT_EXCHANGES.get(exchange)
+        if ccxt_exchange is None:
+            raise Exception('unknown exchange {}'.format(exchange))
+        create = getattr(self, '_create_{}'.format(ccxt_exchange))
+        with self._pooled(('ccxt_client', exchange), create) as client:
+            yield client
+
+    def status(self):
+        with self.pools_lock:
+            pools = dict((key, list(objs)) for key, objs in self.pools.items())
+            pool_stats = dict((key, dict(stats)) for key, stats in self.pool_stats.items())
+
+        status = {}
+        for key, stats in pool_stats.items():
+            exchange_status = status.setdefault(key[1], {
+                'hits': 0,
+                'misses': 0,
+                'in_use': 0,
+                'idle': 0,
+                'idle_connections': 0,
+            })
+            for name in ['hits', 'misses', 'in_use']:
+                exchange_status[name] += stats[name]
+            idle = pools.get(key, [])
+            exchange_status['idle'] += len(idle)
+            exchange_status['idle_connections'] += sum(_idle_connections(obj) for obj in idle)
+        return status
+
+    @contextmanager
+    def _pooled(self, key, create):
+        with self.pools_lock:
+            pool = self.pools[key]
+            obj = pool.pop() if len(pool) > 0 else None
+            stats = self.pool_stats[key]
+            stats['hits' if obj is not None else 'misses'] += 1
+            stats['in_use'] += 1
+
+        try:
+            if obj is None:
+                obj = create()
+            yield obj
+        finally:
+            with self.pools_lock:
+                stats['in_use'] -= 1
+                if obj is not None and len(pool) < self.max_idle:
+                    pool.append(obj)
+
     def create_fetcher(self, exchange=None, logger=None):
         if exchange == 'bybit':
             return BybitFetcher(
@@ -110,3 +182,23 @@ class DataFetcherBuilder:
             wrap_defs=kraken_wrap_defs()
         )
         return client
+
+
+# requests.Sessionのコネクションプールで待機中の接続数
+def _idle_connections(obj):
+    client = getattr(obj, 'ccxt_client', obj)
+    session = getattr(client, 'session', None)
+    if session is None:
+        return 0
+
+    count = 0
+    for adapter in session.adapters.values():
+        poolmanager = getattr(adapter, 'poolmanager', None)
+        if poolmanager is None:
+            continue
+        for key in list(poolmanager.pools.keys()):
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            count += len([conn for conn in list(pool.pool.queue) if conn is not None])
+    return count
@@ -0,0 +1,65 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+# 取引所への問い合わせを1つのevent loopにまとめ、取引所ごとの同時実行数をsemaphoreで制限する
+# fetcher(crypto_data_fetcher)は同期APIなので、呼び出し自体はexecutorのスレッドで行う
+# runは同期APIで、warmupやStoreからはこれまで通りブロックして呼べる
+class FetchLoop:
+    def __init__(self, max_concurrency=8, max_workers=64):
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='fetch')
+        self.loop = asyncio.new_event_loop()
+        self.semaphores = {}
+        self.in_flight = defaultdict(int)
+        self.waiting = defaultdict(int)
+        self.thread = threading.Thread(target=self._run_loop, name='fetch-loop', daemon=True)
+        self.thread.start()
+
+    def submit(self, exchange, fn, *args):
+        return asyncio.run_coroutine_threadsafe(self._call(exchange, fn, args), self.loop)
+
+    def run(self, exchange, fn, *args):
+        return self.submit(exchange, fn, *args).result()
+
+    def status(self):
+        # loopのスレッドだけが更新するので、コピーを読むだけにする
+        in_flight = dict(self.in_flight)
+        waiting = dict(self.waiting)
+        return dict(
+            (str(exchange), {
+                'in_flight': in_flight.get(exchange, 0),
+                'waiting': waiting.get(exchange, 0),
+            })
+            for exchange in sorted(set(in_flight.keys()) | set(waiting.keys()), key=str)
+        )
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _call(self, exchange, fn, args):
+        semaphore = self.semaphores.get(exchange)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphores[exchange] = semaphore
+
+        self.waiting[exchange] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[exchange] -= 1
+
+        self.in_flight[exchange] += 1
+        try:
+            return await self.loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight[exchange] -= 1
+            semaphore.release()
@@ -0,0 +1,63 @@
+from functools import reduce
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# 市場ごとのtable (market, timestamp + 値の列、timestamp順) を共通のtimestampに揃える
+
+
+def timestamp_grid(tables, align='outer'):
+    timestamps = [_timestamps(table) for table in tables]
+    if len(timestamps) == 0:
+        return np.array([], dtype=np.int64)
+    if align == 'inner':
+        return reduce(np.intersect1d, timestamps)
+    return reduce(np.union1d, timestamps)
+
+
+# 各市場の行をgridに揃える。無い足の値はnull
+def align_long(tables, markets, grid):
+    aligned = []
+    for table, market in zip(tables, markets):
+        positions, found = _find(_timestamps(table), grid)
+        table = table.take(pa.array(positions, mask=~found))
+        table = _set_column(table, 'timestamp', pa.array(grid).cast(table.schema.field('timestamp').type))
+        table = _set_column(table, 'market', pa.array([market] * len(grid), type=table.schema.field('market').type))
+        aligned.append(table)
+    return aligned
+
+
+# timestamp x (列, 市場) の表にする (pandasで読むとcolumnsがMultiIndexになる)
+def to_wide(tables, markets, grid):
+    fields = [x for x in tables[0].column_names if x not in ['market', 'timestamp']]
+    columns = {}
+    for field in fields:
+        for table, market in zip(tables, markets):
+            values = table.column(field).to_numpy()
+            column = np.full(len(grid), np.nan, dtype=values.dtype)
+            positions, found = _find(grid, _timestamps(table))
+            column[positions[found]] = values[found]
+            columns[(field, market)] = column
+
+    timestamp_type = tables[0].schema.field('timestamp').type
+    index = pd.DatetimeIndex(pa.array(grid).cast(timestamp_type).to_pandas(), name='timestamp')
+    df = pd.DataFrame(columns, index=index)
+    df.columns.names = [None, 'market']
+    return pa.Table.from_pandas(df)
+
+
+def _timestamps(table):
+    return table.column('timestamp').cast(pa.int64()).to_numpy()
+
+
+# valuesの各要素がsorted_valuesのどこにあるか (positions[found]が有効)
+def _find(sorted_values, values):
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return positions, sorted_values[positions] == values
+
+
+def _set_column(table, name, column):
+    i = table.schema.get_field_index(name)
+    return table.set_column(i, table.schema.field(name), column)
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+MANIFEST_FNAME = '_manifest.json'
+EMPTY_PARTITION = 'empty'
+
+
+# data_dir/<key>/<YYYYMM>.parquet + _manifest.json
+# 追記時は変更があった月以降のパーティションだけ書き直す
+class PartitionedStorage:
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+    def keys(self):
+        keys = []
+        for fname in os.listdir(self.data_dir):
+            path = os.path.join(self.data_dir, fname)
+            if os.path.exists(os.path.join(path, MANIFEST_FNAME)):
+                keys.append(fname)
+            elif fname.endswith('.parquet'):
+                # 旧形式 (1キー1ファイル)
+                keys.append(fname.replace('.parquet', ''))
+        return sorted(set(keys))
+
+    def read_manifest(self, key):
+        path = os.path.join(self._key_dir(key), MANIFEST_FNAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    # 保存するたびに上がる番号。同じdata_dirを読むプロセス間で共通
+    def read_version(self, key):
+        manifest = self.read_manifest(key)
+        if manifest is None:
+            return 0
+        return manifest.get('version', 0)
+
+    def load(self, key):
+        # 別プロセスが保存中だと、読んだmanifestのパーティションが消えていることがあるので読み直す
+        for _ in range(2):
+            try:
+                return self._load(key)
+            except FileNotFoundError:
+                pass
+        return self._load(key)
+
+    def _load(self, key):
+        manifest = self.read_manifest(key)
+        if manifest is None:
+            legacy_path = self._legacy_path(key)
+            if os.path.exists(legacy_path):
+                return pd.read_parquet(legacy_path, memory_map=True)
+            return None
+
+        names = sorted(manifest['partitions'].keys())
+        if len(names) == 0:
+            return None
+        dfs = [pd.read_parquet(self._partition_path(key, name), memory_map=True) for name in names]
+        if len(dfs) == 1:
+            return dfs[0]
+        return pd.concat(dfs)
+
+    def summary(self, key):
+        manifest = self.read_manifest(key)
+        if manifest is None:
+            legacy_path = self._legacy_path(key)
+            if not os.path.exists(legacy_path):
+                return None
+            return {
+                'count': pq.ParquetFile(legacy_path).metadata.num_rows,
+            }
+
+        partitions = [manifest['partitions'][name] for name in sorted(manifest['partitions'].keys())]
+        partitions = [x for x in partitions if x['count'] > 0]
+        if len(partitions) == 0:
+            return {'count': 0}
+        return {
+            'count': sum(x['count'] for x in partitions),
+            'min_timestamp': partitions[0]['min_timestamp'],
+            'max_timestamp': partitions[-1]['max_timestamp'],
+        }
+
+    def save(self, key, df, since=None):
+        manifest = self.read_manifest(key)
+        version = 1 if manifest is None else manifest.get('version', 0) + 1
+        if manifest is None or since is None:
+            since = None
+            manifest = {'partitions': {}}
+        manifest['version'] = version
+
+        key_dir = self._key_dir(key)
+        os.makedirs(key_dir, exist_ok=True)
+
+        if since is None:
+            df_tail = df
+            stale_names = set(manifest['partitions'].keys())
+        else:
+            start = _partition_start(since)
+            df_tail = df.iloc[df.index.searchsorted(start):]
+            stale_names = set(x for x in manifest['partitions'].keys() if x >= _partition_name(start))
+
+        for name, df_partition in _split_partitions(df_tail):
+            _df_save_atomic(df_partition, self._partition_path(key, name))
+            manifest['partitions'][name] = _partition_status(df_partition)
+            stale_names.discard(name)
+
+        for name in stale_names:
+            del manifest['partitions'][name]
+
+        _json_save_atomic(manifest, os.path.join(key_dir, MANIFEST_FNAME))
+
+        for name in stale_names:
+            path = self._partition_path(key, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+        legacy_path = self._legacy_path(key)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+        return version
+
+    # data_dir直下のメタデータ (キーと区別するため名前は_から始める)
+    def read_json(self, name):
+        path = os.path.join(self.data_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_json(self, name, obj):
+        _json_save_atomic(obj, os.path.join(self.data_dir, name))
+
+    def delete(self, key):
+        shutil.rmtree(self._key_dir(key), ignore_errors=True)
+        legacy_path = self._legacy_path(key)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def _key_dir(self, key):
+        return os.path.join(self.data_dir, key)
+
+    def _legacy_path(self, key):
+        return os.path.join(self.data_dir, key + '.parquet')
+
+    def _partition_path(self, key, name):
+        return os.path.join(self._key_dir(key), name + '.parquet')
+
+
+def _partition_start(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.normalize().replace(day=1)
+
+
+def _partition_name(timestamp):
+    return '{:04d}{:02d}'.format(timestamp.year, timestamp.month)
+
+
+def _split_partitions(df):
+    if df.shape[0] == 0:
+        return [(EMPTY_PARTITION, df)]
+
+    months = np.asarray(df.index.year * 100 + df.index.month)
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(months)) + 1, [df.shape[0]]])
+    return [
+        (_partition_name(df.index[bounds[i]]), df.iloc[bounds[i]:bounds[i + 1]])
+        for i in range(len(bounds) - 1)
+    ]
+
+
+def _partition_status(df):
+    if df.shape[0] == 0:
+        return {'count': 0}
+    return {
+        'count': df.shape[0],
+        'min_timestamp': df.index[0].isoformat(),
+        'max_timestamp': df.index[-1].isoformat(),
+    }
+
+
+def _df_save_atomic(df, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _json_save_atomic(obj, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,114 @@
+import logging
+import multiprocessing
+import time
+import click
+from gunicorn.app.base import BaseApplication
+import server
+from store_warmup_scheduler import WarmupPolicy
+
+
+# 取得・保存はingestプロセス1つで行い、gunicornのworkerはdata_dirを読むだけ(read_only)にする
+# parquetの書き出しはworkerの数だけ並列に動く
+class ReadOnlyApplication(BaseApplication):
+    def __init__(self, options=None, store_options=None):
+        self.options = options
+        self.store_options = store_options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # preload_appしないので、fork後のworkerごとに呼ばれる
+        server.initialize(
+            warmup=False,
+            logger=server.app.logger,
+            read_only=True,
+            **self.store_options
+        )
+        return server.app
+
+
+def _run_ingest(store_options, warmup_workers, fetch_concurrency, hot_refresh_sec):
+    logger = logging.getLogger('ingest')
+    logger.setLevel(level=logging.DEBUG)
+    logger.addHandler(logging.StreamHandler())
+
+    server.initialize(
+        warmup=True,
+        logger=logger,
+        warmup_workers=warmup_workers,
+        fetch_concurrency=fetch_concurrency,
+        warmup_policy=WarmupPolicy(hot_refresh_sec=hot_refresh_sec),
+        **store_options
+    )
+    while True:
+        time.sleep(60)
+
+
+@click.command()
+@click.option('--start_time', type=int, default=None, help='data start time')
+@click.option('--min_interval', type=int, default=None, help='min interval')
+@click.option('--data_dir', required=True, help='store data dir shared by ingest and workers (e.g. data/store)')
+@click.option('--memory_limit', type=int, default=None, help='store resident memory limit per process (MB)')
+@click.option('--cold_after_sec', type=int, default=None,
+              help='compress store data not accessed within this (per process)')
+@click.option('--warmup_workers', type=int, default=4, help='warmup workers per exchange')
+@click.option('--fetch_concurrency', type=int, default=8, help='concurrent exchange requests per exchange')
+@click.option('--hot_refresh_sec', type=int, default=60, help='refresh interval')
+@click.option('--cache_bytes', type=int, default=1024, help='response cache size per worker (MB)')
+@click.option('--cache_dir', default=None,
+              help='response cache dir shared by workers (e.g. /dev/shm/crypto_data_server)')
+@click.option('--market_cache_bytes', type=int, default=512, help='per market result cache size per worker (MB)')
+@click.option('--request_workers', type=int, default=16, help='threads per http worker for per market work')
+@click.option('--max_requests', type=int, default=8, help='requests processed at once per http worker')
+@click.option('--max_waiting', type=int, default=32, help='waiting requests per http worker before responding 503')
+@click.option('--workers', type=int, default=multiprocessing.cpu_count(), help='http worker processes')
+@click.option('--threads', type=int, default=4, help='threads per http worker')
+@click.option('--timeout', type=int, default=300, help='http worker timeout (sec)')
+@click.option('--port', type=int, default=5000, help='port')
+@click.option('--host', default='0.0.0.0', help='host')
+def start(start_time, min_interval, data_dir, memory_limit, cold_after_sec, warmup_workers, fetch_concurrency, hot_refresh_sec,
+          cache_bytes, cache_dir, market_cache_bytes, request_workers, max_requests, max_waiting,
+          workers, threads, timeout, port, host):
+    store_options = {
+        'start_time': start_time,
+        'min_interval': min_interval,
+        'data_dir': data_dir,
+        'memory_limit': None if memory_limit is None else memory_limit * 1024 * 1024,
+        'cold_after_sec': cold_after_sec,
+        'cache_bytes': cache_bytes * 1024 * 1024,
+        'cache_dir': cache_dir,
+        'market_cache_bytes': market_cache_bytes * 1024 * 1024,
+    }
+
+    ingest = multiprocessing.Process(
+        target=_run_ingest,
+        args=(store_options, warmup_workers, fetch_concurrency, hot_refresh_sec),
+        name='ingest',
+        daemon=True,
+    )
+    ingest.start()
+
+    worker_options = {
+        'request_workers': request_workers,
+        'max_requests': max_requests,
+        'max_waiting': max_waiting,
+    }
+    worker_options.update(store_options)
+
+    ReadOnlyApplication(
+        options={
+            'bind': '{}:{}'.format(host, port),
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            'timeout': timeout,
+        },
+        store_options=worker_options,
+    ).run()
+
+
+if __name__ == '__main__':
+    start()
@@ -0,0 +1,98 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class Overloaded(Exception):
+    pass
+
+
+# プロセス全体で共有する市場ごとの処理用のスレッドと、リクエストの受け付け制御
+# 同時に処理するリクエストはmax_requestsまで、待てるのはmax_waitingまで(超えたらOverloaded)
+class RequestPool:
+    def __init__(self, workers=16, max_requests=8, max_waiting=32, wait_timeout=30):
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='market')
+        self.semaphore = threading.BoundedSemaphore(max_requests)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.pending_tasks = 0
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'completed': 0,
+        }
+
+    # 受け付けたら解放用の関数を返す。処理が終わったら必ず呼ぶ
+    def admit(self):
+        with self.lock:
+            if self.waiting >= self.max_waiting:
+                self.stats['rejected'] += 1
+                raise Overloaded()
+            self.waiting += 1
+
+        acquired = self.semaphore.acquire(timeout=self.wait_timeout)
+        with self.lock:
+            self.waiting -= 1
+            if not acquired:
+                self.stats['rejected'] += 1
+                raise Overloaded()
+            self.active += 1
+            self.stats['admitted'] += 1
+
+        released = []
+
+        def release():
+            with self.lock:
+                if released:
+                    return
+                released.append(True)
+                self.active -= 1
+                self.stats['completed'] += 1
+            self.semaphore.release()
+
+        return release
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.pending_tasks += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._task_done)
+        return future
+
+    # itemsの順に結果を返す。1リクエストが積むタスクはwindow件までにして、他のリクエストを待たせすぎない
+    def map_ordered(self, fn, items, window=None):
+        if window is None:
+            window = self.workers
+        futures = deque()
+        try:
+            for item in items:
+                futures.append(self.submit(fn, item))
+                if len(futures) >= window:
+                    yield futures.popleft().result()
+            while len(futures) > 0:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def status(self):
+        with self.lock:
+            status = dict(self.stats)
+            status.update({
+                'workers': self.workers,
+                'max_requests': self.max_requests,
+                'max_waiting': self.max_waiting,
+                'active': self.active,
+                'waiting': self.waiting,
+                'queue_depth': self.pending_tasks,
+            })
+        return status
+
+    def _task_done(self, future):
+        with self.lock:
+            self.pending_tasks -= 1
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+
+_HEADER = struct.Struct('<d')
+
+
+def canonical_cache_key(path, args):
+    items = []
+    for name in sorted(set(args.keys())):
+        value = args.get(name)
+        if name == 'markets':
+            value = ','.join(sorted(set(value.split(','))))
+        elif name in ['start_time', 'end_time', 'interval']:
+            try:
+                value = repr(float(value))
+            except ValueError:
+                pass
+        items.append('{}={}'.format(name, value))
+    return path + '?' + '&'.join(items)
+
+
+# レスポンス(bytes)をサイズ上限つきのLRUで保持する
+# cache_dirを指定すると、メモリから溢れたものやほかのプロセスが作ったものもそこから読む
+# (複数プロセスで共有する場合は/dev/shm以下などを指定する)
+# pyarrow.Tableなどnbytesを持つものも入れられるが、それらはcache_dirには書かない
+class ResponseCache:
+    def __init__(self, max_bytes=1024 * 1024 * 1024, cache_dir=None, max_disk_bytes=None, default_timeout=60 * 60):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_bytes if max_disk_bytes is None else max_disk_bytes
+        self.default_timeout = default_timeout
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+        }
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or now < expires_at:
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                self._delete(key)
+
+        entry = self._disk_get(key, now)
+        with self.lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._set_memory(key, entry[0], entry[1])
+        return entry[0]
+
+    # timeout=Noneならdefault_timeout、timeout=0なら期限なし
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires_at = None if timeout == 0 else time.time() + timeout
+
+        with self.lock:
+            self.stats['sets'] += 1
+            self._set_memory(key, value, expires_at)
+        self._disk_set(key, value, expires_at)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+        if self.cache_dir is not None:
+            for fname in os.listdir(self.cache_dir):
+                if fname.endswith('.bin'):
+                    _remove(os.path.join(self.cache_dir, fname))
+
+    def status(self):
+        with self.lock:
+            status = dict(self.stats)
+            status['entries'] = len(self.entries)
+            status['bytes'] = self.total_bytes
+            status['max_bytes'] = self.max_bytes
+        if self.cache_dir is not None:
+            files = self._disk_files()
+            status['disk_entries'] = len(files)
+            status['disk_bytes'] = sum(x[1] for x in files)
+        return status
+
+    def _set_memory(self, key, value, expires_at):
+        self._delete(key)
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        self.entries[key] = (value, expires_at, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes:
+            self._delete(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+    def _delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.bin')
+
+    def _disk_get(self, key, now):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        expires_at, = _HEADER.unpack_from(data)
+        expires_at = None if expires_at == 0 else expires_at
+        if expires_at is not None and expires_at <= now:
+            _remove(path)
+            return None
+        # LRU用にmtimeを更新
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data[_HEADER.size:], expires_at
+
+    def _disk_set(self, key, value, expires_at):
+        if self.cache_dir is None or not isinstance(value, bytes) or len(value) > self.max_disk_bytes:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER.pack(0 if expires_at is None else expires_at))
+                f.write(value)
+            os.replace(tmp_path, self._disk_path(key))
+        finally:
+            _remove(tmp_path)
+
+        files = sorted(self._disk_files(), key=lambda x: x[2])
+        disk_bytes = sum(x[1] for x in files)
+        for path, size, _ in files:
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            _remove(path)
+            disk_bytes -= size
+
+    def _disk_files(self):
+        files = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith('.bin'):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+
+def _nbytes(value):
+    if isinstance(value, bytes):
+        return len(value)
+    return value.nbytes
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,98 @@
+import gzip
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# format: (mimetype, 拡張子, 使える圧縮 (先頭がデフォルト))
+# arrow/featherは無圧縮ならクライアントがコピーせずに読める
+FORMATS = {
+    'parquet': ('application/octet-stream', 'parquet', ['snappy', 'zstd', 'lz4', 'gzip', 'brotli', 'none']),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow', ['none', 'lz4', 'zstd']),
+    'feather': ('application/vnd.apache.arrow.file', 'feather', ['none', 'lz4', 'zstd']),
+    'csv': ('application/gzip', 'csv.gz', ['gzip']),
+}
+
+# Acceptヘッダで指定されたときのformat
+ACCEPT_MIMETYPES = {
+    'application/vnd.apache.parquet': 'parquet',
+    'application/octet-stream': 'parquet',
+    'application/vnd.apache.arrow.stream': 'arrow',
+    'application/vnd.apache.arrow.file': 'feather',
+    'text/csv': 'csv',
+}
+
+
+# 書き込まれたbytesを溜めておき、popで取り出す (レスポンスに流すためのファイル代わり)
+class _ChunkSink:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def resolve_compression(format, compression=None):
+    if format not in FORMATS:
+        raise ValueError('unknown format {}'.format(format))
+    compressions = FORMATS[format][2]
+    if compression is None:
+        return compressions[0]
+    if compression not in compressions:
+        raise ValueError('unknown compression {} for {}'.format(compression, format))
+    return compression
+
+
+# tableを1つずつ書き、書けた分から返す (parquetはtableごとに1つのrow group)
+def iter_response(tables, format, compression=None):
+    compression = resolve_compression(format, compression)
+    if format == 'parquet':
+        return _iter_writer(tables, lambda sink, schema: pq.ParquetWriter(sink, schema, compression=compression))
+    if format == 'arrow':
+        return _iter_writer(tables, lambda sink, schema: pa.ipc.new_stream(sink, schema, options=_ipc_options(compression)))
+    if format == 'feather':
+        return _iter_writer(tables, lambda sink, schema: pa.ipc.new_file(sink, schema, options=_ipc_options(compression)))
+    return _iter_csv_gzip(tables)
+
+
+def _iter_writer(tables, create_writer):
+    sink = _ChunkSink()
+    writer = None
+    for table in tables:
+        if writer is None:
+            writer = create_writer(sink, table.schema)
+        writer.write_table(table)
+        yield sink.pop()
+
+    if writer is not None:
+        writer.close()
+        yield sink.pop()
+
+
+# gzipはメンバーを連結しても1つのファイルとして読めるので、tableごとに圧縮して返す
+def _iter_csv_gzip(tables):
+    header = True
+    for table in tables:
+        yield gzip.compress(table.to_pandas().to_csv(header=header).encode('utf-8'))
+        header = False
+
+
+def _ipc_options(compression):
+    return pa.ipc.IpcWriteOptions(compression=None if compression == 'none' else compression)
@@ -1,20 +1,28 @@
-from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import itertools
 import io
 import logging
 import os
+import time
 import click
-from flask import Flask, request, send_file
-from flask_caching import Cache
+from flask import Flask, Response, abort, request, send_file
 import numpy as np
 import pandas as pd
 import psutil
-from store import Store
+import pyarrow as pa
+from access_tracker import AccessTracker
+from panel import align_long, timestamp_grid, to_wide
+from request_pool import Overloaded, RequestPool
+from response_cache import ResponseCache, canonical_cache_key
+from response_writer import ACCEPT_MIMETYPES, FORMATS, iter_response, resolve_compression
+from store import GAP_MIN_BARS, Store, slice_df
 from store_warmup_bybit import StoreWarpupBybit
 from store_warmup_ftx import StoreWarpupFtx
 from store_warmup_binance_future import StoreWarpupBinanceFuture
 from store_warmup_binance_spot import StoreWarpupBinanceSpot
 from store_warmup_okex import StoreWarpupOkex
 from store_warmup_kraken import StoreWarpupKraken
+from store_warmup_scheduler import StoreWarmupScheduler, WarmupPolicy
 
 app = Flask(__name__)
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
@@ -22,190 +30,499 @@ app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 logger = app.logger
 logger.setLevel(level=logging.DEBUG)
 
-cache = Cache(config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 60 * 60,
-    'CACHE_THRESHOLD': 32
-})
-cache.init_app(app)
+OHLCV_BASE_COLUMNS = ['op', 'hi', 'lo', 'cl', 'volume']
+OHLCV_COLUMNS = OHLCV_BASE_COLUMNS + ['fr'] + [
+    x + suffix for suffix in ['_mark', '_index'] for x in ['op', 'hi', 'lo', 'cl']
+]
 
-store = None
+# 市場以外のリクエストパラメータ (市場ごとのキャッシュキーにも使う)
+_OhlcvParams = namedtuple('_OhlcvParams', [
+    'exchange', 'interval', 'start_time', 'end_time', 'mark', 'index', 'columns', 'float32', 'ffill_fr',
+])
 
-def make_cache_key(*args, **kwargs):
-    path = request.path
-    args = str(hash(frozenset(request.args.items())))
-    return (path + args).encode('utf-8')
+store = None
+warmup_scheduler = None
+access_tracker = AccessTracker()
+response_cache = ResponseCache()
+market_cache = ResponseCache(max_bytes=512 * 1024 * 1024)
+request_pool = RequestPool()
 
-@app.route('/ohlcv.parquet')
-@cache.cached(key_prefix=make_cache_key)
-def ohlcv():
+# キャッシュにヒットしたリクエストも数えるため、キャッシュの外で記録する
+@app.before_request
+def record_access():
+    if request.url_rule is None or request.url_rule.endpoint != 'ohlcv':
+        return
     exchange = request.args.get('exchange')
+    markets = request.args.get('markets')
+    if exchange is None or markets is None:
+        return
+    for market in set(markets.split(',')):
+        access_tracker.record(exchange, market)
+
+# formatはformat=、拡張子、Acceptヘッダの順に決める
+@app.route('/ohlcv', defaults={'path_format': None})
+@app.route('/ohlcv.parquet', defaults={'path_format': 'parquet'})
+@app.route('/ohlcv.arrow', defaults={'path_format': 'arrow'})
+@app.route('/ohlcv.feather', defaults={'path_format': 'feather'})
+@app.route('/ohlcv.csv.gz', defaults={'path_format': 'csv'})
+def ohlcv(path_format):
     markets = sorted(list(set(request.args.get('markets').split(','))))
-    interval = request.args.get('interval', type=int)
-    start_time = request.args.get('start_time', type=float)
-    end_time = request.args.get('end_time', type=float)
+    stream = request.args.get('stream', 0, type=int) != 0
     mark = request.args.get('mark', 0, type=int) != 0
     index = request.args.get('index', 0, type=int) != 0
 
-    def get_df(market):
-        df = store.get_df_ohlcv(
-            exchange=exchange,
-            market=market,
-            interval=interval,
-            price_type=None
-        )
-        if df is None:
-            app.logger.warning('df is None {} {} {}'.format(exchange, market, interval))
-            return None
-        if df.shape[0] == 0:
-            app.logger.warning('df.shape[0] == 0 {} {} {}'.format(exchange, market, interval))
-            return None
-
-        # join fr
+    # columnsを指定したら、必要な列だけ取得して結合する (mark, indexも列から決める)
+    columns = request.args.get('columns')
+    if columns is not None:
+        columns = tuple(dict.fromkeys(columns.split(',')))
+        if any(x not in OHLCV_COLUMNS for x in columns):
+            abort(400)
+        mark = any(x.endswith('_mark') for x in columns)
+        index = any(x.endswith('_index') for x in columns)
+
+    dtype = request.args.get('dtype', 'float64')
+    if dtype not in ['float64', 'float32']:
+        abort(400)
+
+    # layout=wideはtimestamp x (列, 市場)。市場間で足を揃えるのでalignのデフォルトはouter
+    layout = request.args.get('layout', 'long')
+    align = request.args.get('align', 'outer' if layout == 'wide' else None)
+    if layout not in ['long', 'wide'] or align not in [None, 'outer', 'inner']:
+        abort(400)
+
+    params = _OhlcvParams(
+        exchange=request.args.get('exchange'),
+        interval=request.args.get('interval', type=int),
+        start_time=request.args.get('start_time', type=float),
+        end_time=request.args.get('end_time', type=float),
+        mark=mark,
+        index=index,
+        columns=columns,
+        float32=dtype == 'float32',
+        ffill_fr=request.args.get('ffill_fr', 0, type=int) != 0,
+    )
+
+    format = request.args.get('format', path_format)
+    if format is None:
+        mimetype = request.accept_mimetypes.best_match(list(ACCEPT_MIMETYPES.keys()))
+        format = ACCEPT_MIMETYPES.get(mimetype, 'parquet')
+    try:
+        compression = resolve_compression(format, request.args.get('compression'))
+    except ValueError:
+        abort(400)
+    mimetype, extension, _ = FORMATS[format]
+
+    # 市場ごとにでき次第書き出す。レスポンス全体はメモリに持たないのでresponse_cacheは使わない
+    # 足を揃える場合は全市場が揃うまで書き出せないので、streamは無視する
+    if stream and align is None:
+        # 書き出しが終わるまで受け付け枠を使う (レスポンスを返せなかったらここで返す)
+        release = _admit()
+        response = None
+        try:
+            tables = _iter_market_tables(params, markets)
+            # 最初の市場まではここで作り、データが無いなどのエラーはヘッダを返す前に出す
+            first_table = next(tables, None)
+            if first_table is None:
+                abort(404)
+            response = Response(
+                iter_response(itertools.chain([first_table], tables), format, compression),
+                mimetype=mimetype,
+                headers={'Content-Disposition': 'attachment; filename=ohlcv.{}'.format(extension)},
+            )
+            response.call_on_close(release)
+            return response
+        finally:
+            if response is None:
+                release()
+
+    args = request.args.to_dict()
+    args['format'] = format
+    args['compression'] = compression
+    data, _ = _get_cached(
+        response_cache,
+        canonical_cache_key('/ohlcv', args),
+        params.end_time,
+        [key for market in markets for key in _market_source_keys(params, market)],
+        lambda: _run_admitted(_ohlcv_data, params, markets, format, compression, layout, align),
+    )
+
+    return send_file(
+        io.BytesIO(data),
+        mimetype=mimetype,
+        as_attachment=True,
+        attachment_filename='ohlcv.{}'.format(extension)
+    )
+
+# 過去の期間で、すでにend_time以降のデータまで揃っていたものは今後変わらないので期限なしでキャッシュする
+# それ以外は関係するキーのversionをキャッシュキーに含め、storeが更新されたら別のキーになるようにする
+# buildは(値, 今後変わらないか)を返す
+def _get_cached(cache, cache_key, end_time, source_keys, build):
+    complete_cache_key = cache_key + '#complete'
+    if end_time is not None and end_time <= time.time():
+        value = cache.get(complete_cache_key)
+        if value is not None:
+            return value, True
+
+    versions = [store.get_version(key) for key in source_keys]
+    versioned_cache_key = '{}#{}'.format(cache_key, ','.join(map(str, versions)))
+    value = cache.get(versioned_cache_key)
+    if value is not None:
+        return value, False
+
+    value, complete = build()
+    if value is None:
+        return value, complete
+    if complete:
+        cache.set(complete_cache_key, value, timeout=0)
+    elif versions == [store.get_version(key) for key in source_keys]:
+        # 作っている間に更新されたものは、どのversionの結果か分からないのでキャッシュしない
+        cache.set(versioned_cache_key, value)
+    return value, complete
+
+# キャッシュにヒットしたものは受け付け制御の対象にしない
+def _admit():
+    try:
+        return request_pool.admit()
+    except Overloaded:
+        abort(503)
+
+def _run_admitted(fn, *args):
+    release = _admit()
+    try:
+        return fn(*args)
+    finally:
+        release()
+
+def _wants(params, column):
+    return params.columns is None or column in params.columns
+
+def _market_source_keys(params, market):
+    exchange = params.exchange
+    keys = [store.get_ohlcv_source_key(exchange, market, params.interval, None)]
+    if _wants(params, 'fr'):
+        keys.append(store.get_fr_source_key(exchange, market))
+    if params.mark and exchange == 'bybit':
+        keys.append(store.get_ohlcv_source_key(exchange, market, params.interval, 'mark'))
+    if params.index and exchange == 'ftx':
+        keys.append(store.get_ohlcv_source_key(exchange, market, params.interval, 'index'))
+    return [key for key in keys if key is not None]
+
+def _ohlcv_data(params, markets, format, compression, layout, align):
+    results = list(request_pool.map_ordered(lambda market: _get_market_table(params, market), markets))
+    tables = [table for table, _ in results if table is not None]
+    table_markets = [market for market, (table, _) in zip(markets, results) if table is not None]
+    complete = all(market_complete for _, market_complete in results)
+    if len(tables) == 0:
+        abort(404)
+
+    if align is not None:
+        grid = timestamp_grid(tables, align)
+        if layout == 'wide':
+            tables = [to_wide(tables, table_markets, grid)]
+        else:
+            tables = align_long(tables, table_markets, grid)
+
+    # marketsはソート済み、各tableはtimestamp順なので並べ替えは不要
+    return b''.join(iter_response(tables, format, compression)), complete
+
+# marketsの順に、データのある市場のtableを返す
+# 先読みは一定数までにして、書き出しが遅くてもtableが溜まり続けないようにする
+def _iter_market_tables(params, markets):
+    for table, _ in request_pool.map_ordered(lambda market: _get_market_table(params, market), markets):
+        if table is not None:
+            yield table
+
+# 市場ごとの結果をarrowのtableでキャッシュし、銘柄の組み合わせが違うリクエストでも使い回す
+def _get_market_table(params, market):
+    return _get_cached(
+        market_cache,
+        'market={},{}'.format(market, params),
+        params.end_time,
+        _market_source_keys(params, market),
+        lambda: _market_table(params, market),
+    )
+
+def _market_table(params, market):
+    exchange = params.exchange
+    interval = params.interval
+    start_time = params.start_time
+    end_time = params.end_time
+    historical = end_time is not None and end_time <= time.time()
+    end_timestamp = None if end_time is None else pd.to_datetime(end_time, unit='s', utc=True)
+
+    # end_time以降の足がある(もしくは今後取得しない)なら、その期間のデータはもう変わらない
+    def covers(df, key):
+        if not historical:
+            return False
+        if store.is_final(key):
+            return True
+        return df is not None and df.shape[0] > 0 and df.index[-1] >= end_timestamp
+
+    # storeのdfは共有されているので変更せず、期間を切り出してから結合する
+    df = store.get_df_ohlcv(
+        exchange=exchange,
+        market=market,
+        interval=interval,
+        price_type=None
+    )
+    if df is None:
+        app.logger.warning('df is None {} {} {}'.format(exchange, market, interval))
+        return None, False
+    if df.shape[0] == 0:
+        app.logger.warning('df.shape[0] == 0 {} {} {}'.format(exchange, market, interval))
+        return None, False
+    complete = covers(df, store.get_ohlcv_source_key(exchange, market, interval, None))
+    df = slice_df(df, start_time, end_time)
+
+    if params.columns is None:
+        dfs = [df]
+    else:
+        dfs = [df.reindex(columns=[x for x in params.columns if x in OHLCV_BASE_COLUMNS])]
+
+    # join fr
+    if _wants(params, 'fr'):
         df_fr = store.get_df_fr(
             exchange=exchange,
             market=market,
         )
         if df_fr is None:
-            df['fr'] = np.nan
+            dfs.append(pd.DataFrame(np.nan, index=df.index, columns=['fr']))
         else:
-            df = df.join(df_fr)
-
-        # join mark price
-        if mark:
-            if exchange == 'bybit':
-                df_mark = store.get_df_ohlcv(
-                    exchange=exchange,
-                    market=market,
-                    interval=interval,
-                    price_type='mark'
-                )
-            else:
-                df_mark = None
-            if df_mark is None:
-                df['op_mark'] = np.nan
-                df['hi_mark'] = np.nan
-                df['lo_mark'] = np.nan
-                df['cl_mark'] = np.nan
-            else:
-                df = df.join(df_mark, rsuffix='_mark')
-
-        # join index price
-        if index:
-            if exchange == 'ftx':
-                df_index = store.get_df_ohlcv(
-                    exchange=exchange,
-                    market=market,
-                    interval=interval,
-                    price_type='index'
-                )
-            else:
-                df_index = None
-            if df_index is None:
-                df['op_index'] = np.nan
-                df['hi_index'] = np.nan
-                df['lo_index'] = np.nan
-                df['cl_index'] = np.nan
+            complete = complete and covers(df_fr, store.get_fr_source_key(exchange, market))
+            if params.ffill_fr:
+                # 期間の最初の足にも直前のfrが入るよう、切り出す前のdfから埋める
+                dfs.append(df_fr.reindex(df.index, method='ffill'))
             else:
-                df = df.join(df_index, rsuffix='_index')
+                dfs.append(slice_df(df_fr, start_time, end_time).reindex(df.index))
 
-        if start_time is not None:
-            df = df[pd.to_datetime(start_time, unit='s', utc=True) <= df.index]
-        if end_time is not None:
-            df = df[df.index < pd.to_datetime(end_time, unit='s', utc=True)]
-        df = df.reset_index()
-        df['market'] = market
-        df = df.set_index(['market', 'timestamp'])
-        return df
+    # join mark price
+    if params.mark:
+        if exchange == 'bybit':
+            df_mark = store.get_df_ohlcv(
+                exchange=exchange,
+                market=market,
+                interval=interval,
+                price_type='mark',
+            )
+            complete = complete and covers(
+                df_mark, store.get_ohlcv_source_key(exchange, market, interval, 'mark'))
+            df_mark = slice_df(df_mark, start_time, end_time)
+        else:
+            df_mark = None
+        dfs.append(_join_part(df, df_mark, '_mark'))
 
-    with ThreadPoolExecutor(16) as executor:
-        dfs = executor.map(get_df, markets)
-        dfs = [df for df in dfs if df is not None]
+    # join index price
+    if params.index:
+        if exchange == 'ftx':
+            df_index = store.get_df_ohlcv(
+                exchange=exchange,
+                market=market,
+                interval=interval,
+                price_type='index',
+            )
+            complete = complete and covers(
+                df_index, store.get_ohlcv_source_key(exchange, market, interval, 'index'))
+            df_index = slice_df(df_index, start_time, end_time)
+        else:
+            df_index = None
+        dfs.append(_join_part(df, df_index, '_index'))
 
-    df = pd.concat(dfs)
-    df = df.sort_values(['market', 'timestamp'])
+    df = pd.concat(dfs, axis=1)
+    if params.columns is not None:
+        df = df.reindex(columns=list(params.columns))
+    if params.float32:
+        df = df.astype(dict((x, np.float32) for x in df.columns if df[x].dtype == np.float64))
+    df.index = pd.MultiIndex(
+        levels=[[market], df.index],
+        codes=[np.zeros(df.shape[0], dtype=np.int64), np.arange(df.shape[0])],
+        names=['market', 'timestamp'],
+    )
+    return pa.Table.from_pandas(df), complete
 
-    f = io.BytesIO()
-    df.to_parquet(f)
-    f.seek(0)
+def _join_part(df, df_part, suffix):
+    columns = ['op', 'hi', 'lo', 'cl']
+    if df_part is None:
+        return pd.DataFrame(np.nan, index=df.index, columns=[x + suffix for x in columns])
 
-    return send_file(
-        f,
-        mimetype='application/octet-stream',
-        as_attachment=True,
-        attachment_filename='%ohlcv.parquet'
-    )
+    df_part = df_part.reindex(df.index)
+    df_part.columns = [x + suffix if x in df.columns else x for x in df_part.columns]
+    return df_part
+
+# 保存済みの足の途中の穴 (取引所には問い合わせない)。埋めるにはsrc/backfill.pyを使う
+@app.route('/gaps')
+def gaps():
+    exchange = request.args.get('exchange')
+    market = request.args.get('market')
+    interval = request.args.get('interval', type=int)
+    if exchange is None or market is None or interval is None:
+        abort(400)
+    price_type = request.args.get('price_type')
+    min_gap_bars = request.args.get('min_gap_bars', GAP_MIN_BARS, type=int)
+
+    return {
+        'key': store.get_ohlcv_source_key(exchange, market, interval, price_type),
+        'gaps': [
+            {'start_time': start, 'end_time': end, 'missing_bars': bars}
+            for start, end, bars in store.get_gaps(
+                exchange=exchange,
+                market=market,
+                interval=interval,
+                price_type=price_type,
+                min_gap_bars=min_gap_bars,
+            )
+        ],
+    }
 
 @app.route('/status')
 def status():
     process = psutil.Process(os.getpid())
     return {
         'store': store.status(),
+        'fetcher_pool': store.fetcher_builder.status(),
+        'warmup': None if warmup_scheduler is None else warmup_scheduler.status(),
+        'access': access_tracker.status(),
+        'response_cache': response_cache.status(),
+        'market_cache': market_cache.status(),
+        'request_pool': request_pool.status(),
         'memory': {
             'rss': process.memory_info().rss
         }
     }
 
-def initialize(start_time=None, min_interval=None, warmup=False, logger=None):
-    logger.info('initialize start_time={} min_interval={} warmup={}'.format(start_time, min_interval, warmup))
+def initialize(start_time=None, min_interval=None, warmup=False, logger=None, data_dir=None, memory_limit=None,
+               cold_after_sec=None, warmup_workers=4, warmup_policy=None, cache_bytes=None, cache_dir=None, market_cache_bytes=None,
+               read_only=False, fetch_concurrency=8, request_workers=16, max_requests=8, max_waiting=32):
+    logger.info('initialize start_time={} min_interval={} warmup={} data_dir={} memory_limit={} warmup_workers={} cache_bytes={} cache_dir={} market_cache_bytes={} read_only={}'.format(
+        start_time, min_interval, warmup, data_dir, memory_limit, warmup_workers, cache_bytes, cache_dir, market_cache_bytes, read_only))
+
+    global store, warmup_scheduler, response_cache, market_cache, request_pool
+    request_pool = RequestPool(workers=request_workers, max_requests=max_requests, max_waiting=max_waiting)
+
+    # キャッシュはstoreのversionに紐付いているので、storeを作り直したら捨てる
+    response_cache = ResponseCache(
+        max_bytes=response_cache.max_bytes if cache_bytes is None else cache_bytes,
+        cache_dir=cache_dir,
+    )
+    market_cache = ResponseCache(
+        max_bytes=market_cache.max_bytes if market_cache_bytes is None else market_cache_bytes,
+    )
+
+    # 前のstoreのwarmupと取得用のスレッドを止めてから作り直す
+    if warmup_scheduler is not None:
+        warmup_scheduler.stop()
+    if store is not None:
+        store.close()
 
-    global store
     store = Store(
         logger=logger,
         start_time=start_time,
-        # data_dir=os.path.join(os.path.dirname(__file__), 'data/store'),
+        min_interval=min_interval,
+        data_dir=data_dir,
+        memory_limit=memory_limit,
+        cold_after_sec=cold_after_sec,
+        read_only=read_only,
+        fetch_concurrency=fetch_concurrency,
     )
+    warmup_scheduler = None
 
     if warmup:
-        warpup_bybit = StoreWarpupBybit(
-            store=store,
-            logger=logger,
-            min_interval=min_interval,
-        )
-        warpup_bybit.start()
-
-        warpup_ftx = StoreWarpupFtx(
+        warmups = [
+            StoreWarpupBybit(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+            StoreWarpupFtx(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+            StoreWarpupBinanceFuture(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+            StoreWarpupBinanceSpot(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+            StoreWarpupOkex(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+            StoreWarpupKraken(
+                store=store,
+                logger=logger,
+                min_interval=min_interval,
+            ),
+        ]
+        warmup_scheduler = StoreWarmupScheduler(
             store=store,
             logger=logger,
-            min_interval=min_interval,
+            warmups=warmups,
+            workers=warmup_workers,
+            policy=warmup_policy,
         )
-        warpup_ftx.start()
-
-        warpup_binance_future = StoreWarpupBinanceFuture(
-            store=store,
-            logger=logger,
-            min_interval=min_interval,
-        )
-        warpup_binance_future.start()
-
-        warpup_binance_spot = StoreWarpupBinanceSpot(
-            store=store,
-            logger=logger,
-            min_interval=min_interval,
-        )
-        warpup_binance_spot.start()
-
-        warpup_okex = StoreWarpupOkex(
-            store=store,
-            logger=logger,
-            min_interval=min_interval,
-        )
-        warpup_okex.start()
-
-        warpup_kraken = StoreWarpupKraken(
-            store=store,
-            logger=logger,
-            min_interval=min_interval,
-        )
-        warpup_kraken.start()
+        warmup_scheduler.start()
 
 @click.command()
 @click.option('--start_time', type=int, default=None, help='data start time')
 @click.option('--min_interval', type=int, default=None, help='min interval')
+@click.option('--data_dir', default=None, help='store data dir (e.g. data/store)')
+@click.option('--memory_limit', type=int, default=None, help='store resident memory limit (MB). requires data_dir')
+@click.option('--cold_after_sec', type=int, default=None, help='compress store data not accessed within this')
+@click.option('--warmup_workers', type=int, default=4, help='warmup workers per exchange')
+@click.option('--fetch_concurrency', type=int, default=8, help='concurrent exchange requests per exchange')
+@click.option('--warmup_policy', type=click.Choice(['all', 'demand']), default='all',
+              help='all: refresh every key. demand: refresh by /ohlcv.parquet access')
+@click.option('--hot_refresh_sec', type=int, default=60, help='refresh interval of recently requested keys')
+@click.option('--cold_refresh_sec', type=int, default=60 * 60, help='refresh interval of other keys (demand)')
+@click.option('--hot_window_sec', type=int, default=60 * 60, help='keys requested within this are hot (demand)')
+@click.option('--idle_expiry_sec', type=int, default=None,
+              help='stop refreshing keys not requested within this (demand)')
+@click.option('--cache_bytes', type=int, default=1024, help='response cache size (MB)')
+@click.option('--cache_dir', default=None,
+              help='response cache dir shared by processes (e.g. /dev/shm/crypto_data_server)')
+@click.option('--market_cache_bytes', type=int, default=512, help='per market result cache size (MB)')
+@click.option('--request_workers', type=int, default=16, help='threads shared by requests for per market work')
+@click.option('--max_requests', type=int, default=8, help='requests processed at once (others wait)')
+@click.option('--max_waiting', type=int, default=32, help='waiting requests before responding 503')
 @click.option('--port', type=int, default=5000, help='port')
 @click.option('--host', default='0.0.0.0', help='host')
-def start(start_time, min_interval, port, host):
-    initialize(start_time=start_time, min_interval=min_interval, warmup=True, logger=app.logger)
+def start(start_time, min_interval, data_dir, memory_limit, cold_after_sec, warmup_workers, fetch_concurrency, warmup_policy,
+          hot_refresh_sec, cold_refresh_sec, hot_window_sec, idle_expiry_sec, cache_bytes, cache_dir, market_cache_bytes,
+          request_workers, max_requests, max_waiting, port, host):
+    if warmup_policy == 'demand':
+        policy = WarmupPolicy(
+            access_tracker=access_tracker,
+            hot_refresh_sec=hot_refresh_sec,
+            cold_refresh_sec=cold_refresh_sec,
+            hot_window_sec=hot_window_sec,
+            idle_expiry_sec=idle_expiry_sec,
+        )
+    else:
+        policy = WarmupPolicy(hot_refresh_sec=hot_refresh_sec)
+
+    initialize(
+        start_time=start_time,
+        min_interval=min_interval,
+        warmup=True,
+        logger=app.logger,
+        data_dir=data_dir,
+        memory_limit=None if memory_limit is None else memory_limit * 1024 * 1024,
+        cold_after_sec=cold_after_sec,
+        warmup_workers=warmup_workers,
+        fetch_concurrency=fetch_concurrency,
+        warmup_policy=policy,
+        cache_bytes=cache_bytes * 1024 * 1024,
+        cache_dir=cache_dir,
+        market_cache_bytes=market_cache_bytes * 1024 * 1024,
+        request_workers=request_workers,
+        max_requests=max_requests,
+        max_waiting=max_waiting,
+    )
     app.run(debug=False, port=port, host=host, threaded=True)
 
 if __name__ == '__main__':
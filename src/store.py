@@ -1,27 +1,156 @@
-from collections import defaultdict
-import os
+from collections import OrderedDict, defaultdict
 import re
-import tempfile
 import threading
+import time
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from columnar_series import ColumnarSeries
 from data_fetcher_builder import DataFetcherBuilder
+from fetch_loop import FetchLoop
+from partitioned_storage import PartitionedStorage
+
+# 取引所が共通でサポートしている足。細かい順に並べる
+# これらから合成できる足は取引所に問い合わせずにリサンプリングで作る
+RESAMPLE_BASE_INTERVALS = [
+    60,
+    5 * 60,
+    15 * 60,
+    60 * 60,
+]
+
+SEALED_FNAME = '_sealed.json'
+GAPS_FNAME = '_gaps.json'
+
+# この本数以上の足が欠けていたら穴とみなす (取引のない足を返さない取引所もある)
+GAP_MIN_BARS = 10
+
+# bybitのfrはpremium_indexの8時間ごとの平均から計算する
+BYBIT_FR_PERIOD = pd.to_timedelta(8, unit='h')
+BYBIT_FR_INTEREST_RATE = (0.0006 - 0.0003) / 3.0
+
+RESAMPLE_AGGS = {
+    'op': 'first',
+    'hi': 'max',
+    'lo': 'min',
+    'cl': 'last',
+}
 
 
 class Store:
-    def __init__(self, logger=None, start_time=None, data_dir=None):
+    def __init__(self, logger=None, start_time=None, data_dir=None, min_interval=None, memory_limit=None,
+                 read_only=False, version_check_interval=1, fetch_concurrency=8, cold_after_sec=None):
         self.fetcher_builder = DataFetcherBuilder()
+        # warmupとリクエストからの取得をまとめて、取引所ごとにfetch_concurrencyまで同時に実行する
+        self.fetch_loop = None if read_only else FetchLoop(max_concurrency=fetch_concurrency)
+        # dfsのdfはseriesの配列を参照している (取得のたびにdf全体を持ち直さず、変わった末尾だけ書き込む)
         self.dfs = {}
+        self.series = {}
+        self.versions = defaultdict(int)
+        self.resampled_dfs = {}
+        # 他のキーから計算して保存しているキーの、計算元のversion
+        self.derived_versions = {}
         self.data_dir = data_dir
         self.locks = defaultdict(threading.Lock)
         self.locks_lock = threading.Lock()
         self.logger = logger
         self.start_time = start_time
+        self.min_interval = min_interval
+
+        # メモリ上のdfをLRUで管理し、memory_limit(bytes)を超えたら古いものから捨てる
+        # data_dirに保存済みのものは次のアクセスで読み直す
+        self.memory_limit = memory_limit
+        self.memory_usage = OrderedDict()
+        self.memory_usage_total = 0
+        self.memory_lock = threading.Lock()
+
+        # cold_after_sec秒アクセスのないdfはzstdで圧縮したArrow IPCにして持ち、次のアクセスで戻す
+        self.cold_after_sec = cold_after_sec
+        self.cold_dfs = {}
+        self.access_times = {}
+        self.closed = threading.Event()
+        self.cold_thread = None
+        if cold_after_sec is not None:
+            self.cold_thread = threading.Thread(target=self._run_compress_cold, name='store-cold', daemon=True)
+            self.cold_thread.start()
+
+        # 満期になった先物や上場廃止された市場はsealし、
+        # seal後に一度取得したキー(final_keys)はそれ以降取引所に問い合わせない
+        self.sealed_markets = {}
+        self.final_keys = {}
+        self.sealed_lock = threading.Lock()
+
+        # read_onlyなら取引所には問い合わせず、別プロセスがdata_dirに保存したものを読むだけ
+        # 保存済みのversionをversion_check_interval秒ごとに確認し、変わっていたら読み直す
+        self.read_only = read_only
+        self.version_check_interval = version_check_interval
+        self.version_checked = {}
+
+        # 取得し直しても埋まらなかった穴 (取引所にデータがない)。backfillで再び取得しない
+        self.confirmed_gaps = {}
+        self.gaps_lock = threading.Lock()
+
+        self.storage = None
+        self.stored_keys = set()
 
         if data_dir is not None:
-            os.makedirs(data_dir, exist_ok=True)
-            for fname in os.listdir(data_dir):
-                key = fname.replace('.parquet', '')
-                self.dfs[key] = pd.read_parquet(os.path.join(data_dir, fname))
+            self.storage = PartitionedStorage(data_dir)
+            # 起動時はキーの登録だけ行い、読み込みは最初のアクセス時
+            self.stored_keys = set(self.storage.keys())
+
+            sealed = self.storage.read_json(SEALED_FNAME)
+            if sealed is not None:
+                self.sealed_markets = dict(((x[0], x[1]), x[2]) for x in sealed['markets'])
+                self.final_keys = dict((key, tuple(x)) for key, x in sealed['final_keys'].items())
+
+            gaps = self.storage.read_json(GAPS_FNAME)
+            if gaps is not None:
+                self.confirmed_gaps = dict((key, set(tuple(x) for x in ranges)) for key, ranges in gaps.items())
+
+    def seal_market(self, exchange, market):
+        with self.sealed_lock:
+            if (exchange, market) in self.sealed_markets:
+                return
+            self.sealed_markets[(exchange, market)] = time.time()
+            self._save_sealed()
+
+    def unseal_market(self, exchange, market):
+        with self.sealed_lock:
+            if (exchange, market) not in self.sealed_markets:
+                return
+            del self.sealed_markets[(exchange, market)]
+            for key, x in list(self.final_keys.items()):
+                if x == (exchange, market):
+                    del self.final_keys[key]
+            self._save_sealed()
+
+    # 取引が再開した市場はunsealして、次の更新から再び取得する
+    def set_sealed(self, exchange, market, sealed):
+        if sealed:
+            self.seal_market(exchange, market)
+        else:
+            self.unseal_market(exchange, market)
+
+    def is_sealed(self, exchange, market):
+        return (exchange, market) in self.sealed_markets
+
+    def is_final(self, key):
+        return key in self.final_keys
+
+    def _finalize(self, key, exchange, market):
+        with self.sealed_lock:
+            if key in self.final_keys or (exchange, market) not in self.sealed_markets:
+                return
+            self.final_keys[key] = (exchange, market)
+            self._save_sealed()
+
+    def _save_sealed(self):
+        if self.storage is None:
+            return
+        self.storage.save_json(SEALED_FNAME, {
+            'markets': [[x[0], x[1], sealed_at] for x, sealed_at in self.sealed_markets.items()],
+            'final_keys': dict((key, list(x)) for key, x in self.final_keys.items()),
+        })
 
     def _get_lock(self, key):
         with self.locks_lock:
@@ -30,105 +159,610 @@ class Store:
     def status(self):
         dfs_status = {}
 
-        for key in self.dfs:
-            with self._get_lock(key):
-                df = self.dfs.get(key)
-                if df is None:
-                    dfs_status[key] = None
-                else:
-                    dfs_status[key] = {
-                        'count': df.shape[0],
-                        'min_timestamp': df.index.min().isoformat(),
-                        'max_timestamp': df.index.max().isoformat(),
-                    }
+        cold_dfs = dict(self.cold_dfs)
+        for key in sorted(self.stored_keys | set(self.dfs.keys()) | set(cold_dfs.keys())):
+            df = self.dfs.get(key)
+            cold = cold_dfs.get(key) if df is None else None
+            if cold is not None:
+                dfs_status[key] = dict(cold[1])
+            elif df is None and key in self.stored_keys:
+                dfs_status[key] = self.storage.summary(key)
+            else:
+                dfs_status[key] = _df_status(df)
+            if dfs_status[key] is not None:
+                dfs_status[key]['resident'] = df is not None
+                dfs_status[key]['cold'] = cold is not None
+
+        for key in list(self.resampled_dfs.keys()):
+            cached = self.resampled_dfs.get(key)
+            if cached is not None:
+                dfs_status[key] = _df_status(cached[1])
+                dfs_status[key]['resident'] = True
 
         return {
             'start_time': self.start_time,
             'dfs': dfs_status,
+            'sealed': {
+                'markets': len(self.sealed_markets),
+                'final_keys': len(self.final_keys),
+            },
+            'memory': {
+                'limit': self.memory_limit,
+                'usage': self.memory_usage_total,
+                'resident_count': len(self.memory_usage),
+                'hot_count': len(self.memory_usage) - len(cold_dfs),
+                'hot_bytes': self.memory_usage_total - sum(len(x[0]) for x in cold_dfs.values()),
+                'cold_count': len(cold_dfs),
+                'cold_bytes': sum(len(x[0]) for x in cold_dfs.values()),
+                'cold_after_sec': self.cold_after_sec,
+            },
+            'fetch': None if self.fetch_loop is None else self.fetch_loop.status(),
         }
 
-    def get_df_ohlcv(self, exchange=None, market=None, interval=None, price_type=None, force_fetch=False):
+    def get_ohlcv_fetch_interval(self, interval):
+        return _ohlcv_fetch_interval(interval, self.min_interval)
+
+    # storeが更新されると上がる番号。data_dirがあれば保存時の番号なので、同じdata_dirを読むプロセス間で共通
+    def get_version(self, key):
+        if self.read_only:
+            return self._get_stored_version(key)
+        if key not in self.versions and key in self.stored_keys:
+            return self.storage.read_version(key)
+        return self.versions[key]
+
+    def _get_stored_version(self, key):
+        now = time.time()
+        checked = self.version_checked.get(key)
+        if checked is None or now - checked[0] >= self.version_check_interval:
+            checked = (now, self.storage.read_version(key))
+            self.version_checked[key] = checked
+        return checked[1]
+
+    # 指定した足を作るときに実際に取得しているキー (更新の有無はこのキーのversionで分かる)
+    def get_ohlcv_source_key(self, exchange, market, interval, price_type):
+        return _ohlcv_key(exchange, market, self.get_ohlcv_fetch_interval(interval), price_type)
+
+    def get_fr_source_key(self, exchange, market):
+        if exchange == 'bybit' and re.search(r'\d', market):
+            return None
+
+        if exchange == 'ftx' and '-PERP' not in market:
+            return None
+
+        if exchange in ['binance_future', 'binance_spot', 'okex']:
+            return None
+
+        return _fr_key(exchange, market)
+
+    def get_range(self, key, start_time=None, end_time=None):
+        df = self.dfs.get(key)
+        if df is None and (key in self.stored_keys or key in self.cold_dfs):
+            df, _ = self._get_df(key, lambda df: df)
+        if df is None:
+            cached = self.resampled_dfs.get(key)
+            if cached is not None:
+                df = cached[1]
+        return slice_df(df, start_time, end_time)
+
+    def get_df_ohlcv(self, exchange=None, market=None, interval=None, price_type=None, force_fetch=False,
+                     start_time=None, end_time=None):
         self.logger.info('get_df_ohlcv {} {} {} {}'.format(exchange, market, interval, price_type))
 
+        fetch_interval = self.get_ohlcv_fetch_interval(interval)
+        df, version = self._get_df_ohlcv_fetched(
+            exchange=exchange,
+            market=market,
+            interval=fetch_interval,
+            price_type=price_type,
+            force_fetch=force_fetch,
+        )
+
+        if df is not None and fetch_interval != interval:
+            key = _ohlcv_key(exchange, market, interval, price_type)
+            cached = self.resampled_dfs.get(key)
+            if cached is None or cached[0] != version:
+                with self._get_lock(key):
+                    cached = self.resampled_dfs.get(key)
+                    if cached is None or cached[0] != version:
+                        cached = (version, _resample_ohlcv(
+                            df,
+                            base_interval=fetch_interval,
+                            interval=interval,
+                            start_time=self.start_time,
+                        ))
+                        self.resampled_dfs[key] = cached
+            df = cached[1]
+            self._touch(key, df)
+
+        return slice_df(df, start_time, end_time)
+
+    def _get_df_ohlcv_fetched(self, exchange=None, market=None, interval=None, price_type=None, force_fetch=False):
         key = _ohlcv_key(exchange, market, interval, price_type)
-        fetcher = self.fetcher_builder.create_fetcher(exchange=exchange, logger=self.logger)
+        fetch = self._ohlcv_fetch(exchange, market, interval, price_type)
+        df, version = self._get_df(key, fetch, force_fetch=force_fetch, exchange=exchange, market=market)
 
-        with self._get_lock(key):
-            df = self.dfs.get(key)
+        # premium_indexを更新したら、frも合わせて更新する (warmupはpremium_indexだけ取得する)
+        if exchange == 'bybit' and interval == 60 and price_type == 'premium_index' and not self.read_only:
+            self._update_bybit_fr(market, df, version)
+
+        return df, version
 
-            if force_fetch or df is None:
-                df = fetcher.fetch_ohlcv(
+    def _ohlcv_fetch(self, exchange, market, interval, price_type):
+        def fetch(df):
+            with self.fetcher_builder.fetcher(exchange=exchange, logger=self.logger) as fetcher:
+                return fetcher.fetch_ohlcv(
                     df=df,
                     start_time=self.start_time,
                     interval_sec=interval,
                     market=market,
                     price_type=price_type
                 )
+        return fetch
+
+    # 保存済み(もしくはメモリ上)の足の途中の穴。取引所には問い合わせない
+    # (start_time, end_time, 欠けている本数) のリスト。start_time <= timestamp < end_timeが欠けている
+    def get_gaps(self, exchange=None, market=None, interval=None, price_type=None, min_gap_bars=GAP_MIN_BARS):
+        fetch_interval = self.get_ohlcv_fetch_interval(interval)
+        key = _ohlcv_key(exchange, market, fetch_interval, price_type)
+        return _find_gaps(self.get_range(key), fetch_interval, min_gap_bars, self.confirmed_gaps.get(key))
+
+    # 最初の穴の手前から取得し直して、穴を埋める (fetcherは渡したdfの最後から取得する)
+    # fetcherは終わりを指定できないので、最初の穴以降を全て取得し直し、そこから後のパーティションを全て書き直す
+    # min_gap_timeより前に始まる穴は無視する (古い穴1つのために全期間を取得し直さないように)
+    # 埋まった穴を返す。埋まらなかった穴は以降backfillしない
+    def backfill(self, exchange=None, market=None, interval=None, price_type=None, min_gap_bars=GAP_MIN_BARS,
+                 min_gap_time=None):
+        interval = self.get_ohlcv_fetch_interval(interval)
+        key = _ohlcv_key(exchange, market, interval, price_type)
+        fetch = self._ohlcv_fetch(exchange, market, interval, price_type)
 
-                self.dfs[key] = df
+        with self._get_lock(key):
+            df_old = self._load_df(key)
+            gaps = _find_gaps(df_old, interval, min_gap_bars, self.confirmed_gaps.get(key))
+            gaps = [x for x in gaps if min_gap_time is None or x[0] >= min_gap_time]
+            if len(gaps) == 0:
+                return []
+
+            self.logger.info('backfill {} {}'.format(key, gaps))
+            df_head = df_old.iloc[:df_old.index.searchsorted(pd.to_datetime(gaps[0][0], unit='s', utc=True))]
+            df_fetched = self.fetch_loop.run(exchange, fetch, df_head)
+            if df_fetched is None or df_fetched.shape[0] == 0:
+                return []
+            df = pd.concat([df_fetched, df_old[df_old.index > df_fetched.index[-1]]])
+            since = df_head.index[-1]
+            self._publish_df(key, df_old, df, since=since)
+
+            fetched_start = since.timestamp()
+            fetched_end = df_fetched.index[-1].timestamp()
+            remaining = _find_gaps(df, interval, min_gap_bars, self.confirmed_gaps.get(key))
+            self._confirm_gaps(key, [x for x in remaining if fetched_start <= x[0] and x[1] <= fetched_end])
+
+            if exchange == 'bybit' and interval == 60 and price_type == 'premium_index':
+                self._update_bybit_fr(market, df, self.versions[key], since=since)
+
+        remaining = set((x[0], x[1]) for x in remaining)
+        return [x for x in gaps if (x[0], x[1]) not in remaining]
+
+    def _confirm_gaps(self, key, gaps):
+        if len(gaps) == 0:
+            return
+        with self.gaps_lock:
+            confirmed = self.confirmed_gaps.setdefault(key, set())
+            confirmed.update((x[0], x[1]) for x in gaps)
+            if self.storage is not None:
+                self.storage.save_json(GAPS_FNAME, dict(
+                    (k, sorted(list(x) for x in ranges)) for k, ranges in self.confirmed_gaps.items()
+                ))
+
+    # 読み出しはロックを取らず、公開済みのdf(スナップショット)をそのまま返す
+    # ロックは取得処理の直列化にだけ使い、取得後にself.dfsを差し替える
+    # 返したdfは他のリクエストと共有しているので、呼び出し側で変更してはいけない
+    def _get_df(self, key, fetch, force_fetch=False, exchange=None, market=None):
+        version = self.versions[key]
+        df = self.dfs.get(key)
+        if key in self.final_keys:
+            force_fetch = False
+        if self.read_only:
+            force_fetch = self.get_version(key) != version
+
+        if df is None:
+            # 同じキーの取得が同時に来たら、最初の取得の結果を共有する
+            with self._get_lock(key):
+                df, version = self._fetch_df(key, fetch, force_fetch=force_fetch, exchange=exchange, market=market)
+        elif force_fetch:
+            lock = self._get_lock(key)
+            if lock.acquire(blocking=False):
+                try:
+                    df, version = self._fetch_df(key, fetch, force_fetch=True, exchange=exchange, market=market)
+                finally:
+                    lock.release()
+            else:
+                # 他のスレッドが更新中なら、それを待って結果を使う
+                with lock:
+                    version = self.versions[key]
+                    df = self.dfs.get(key)
+
+        self._touch(key, df)
+        return df, version
+
+    def _fetch_df(self, key, fetch, force_fetch=False, exchange=None, market=None):
+        # self._get_lock(key)を取った状態で呼ぶ
+        if self.read_only:
+            return self._reload_df(key)
+
+        df_old = self._load_df(key)
+        df = df_old
+
+        if force_fetch or (df is None and key not in self.final_keys):
+            # seal後に始めた取得なら、その結果は以降変わらない
+            sealed = self.is_sealed(exchange, market)
+            df = self.fetch_loop.run(exchange, fetch, df)
+            self._publish_df(key, df_old, df)
+
+            if sealed:
+                self._finalize(key, exchange, market)
+
+        return df, self.versions[key]
+
+    def _load_df(self, key):
+        # self._get_lock(key)を取った状態で呼ぶ
+        df = self.dfs.get(key)
+        cold = self.cold_dfs.get(key) if df is None else None
+        if cold is not None:
+            # dfsに戻してからcold_dfsから消す (読み出し側はdfs, cold_dfsの順に見る)
+            df = self._to_columnar(key, _decompress_df(cold[0]))
+            self.dfs[key] = df
+            self.cold_dfs.pop(key, None)
+        elif df is None and key in self.stored_keys:
+            df = self._to_columnar(key, self.storage.load(key))
+            self.versions[key] = self.storage.read_version(key)
+            self.dfs[key] = df
+        return df
 
+    # sinceを渡したら、それ以降が変わったものとして保存する (途中の行が変わったとき)
+    def _publish_df(self, key, df_old, df, since=None):
+        # self._get_lock(key)を取った状態で呼ぶ
+        if since is not None or not _df_equals_tail(df_old, df):
+            version = self.versions[key] + 1
+            if since is None:
+                since = _df_changed_since(df_old, df)
+            if self.storage is not None and df is not None:
+                version = self.storage.save(key, df, since=since)
+                self.stored_keys.add(key)
+            # versionはdfを差し替えてから上げる (読み出し側はversion, dfの順に読む)
+            self.dfs[key] = self._to_columnar(key, df, since=since)
+            self.versions[key] = version
+        elif df_old is None:
+            self.dfs[key] = df
+
+    # dfをkeyのseriesに書き込み、それを参照するdfを返す。sinceより前は変わっていないものとする
+    # 以前に返したdfの行は書き換えない (変わった行があればseriesが新しい領域に作り直す)
+    def _to_columnar(self, key, df, since=None):
+        if not ColumnarSeries.supports(df):
+            self.series.pop(key, None)
+            return df
+
+        series = self.series.get(key)
+        if series is None or series.columns != list(df.columns):
+            series = ColumnarSeries.from_df(df)
+            self.series[key] = series
+        else:
+            if since is not None:
+                df = df.iloc[df.index.searchsorted(since):]
+            series.update(df)
+        return series.to_df()
+
+    def _reload_df(self, key):
+        # versionを先に読むので、読んだdfはそのversion以降のもの
+        version = self.storage.read_version(key)
+        if key in self.cold_dfs:
+            if self.versions[key] == version:
+                self._load_df(key)
+            else:
+                self.cold_dfs.pop(key, None)
+        if key not in self.dfs or self.versions[key] != version:
+            df = self.storage.load(key)
             if df is not None:
-                df = df.copy()
-
-        if self.data_dir is not None and df is not None:
-            _df_save_atomic(df, os.path.join(self.data_dir, key + '.parquet'))
+                self.stored_keys.add(key)
+            self.versions[key] = version
+            # 別プロセスがどこを書き直したか分からないので、seriesは作り直す
+            self.series.pop(key, None)
+            self.dfs[key] = self._to_columnar(key, df)
+        return self.dfs[key], self.versions[key]
+
+    def _touch(self, key, df):
+        if df is None:
+            return
+
+        with self.memory_lock:
+            series = self.series.get(key)
+            if series is None:
+                nbytes = int(df.memory_usage(index=True).sum())
+            else:
+                # dfのindexと値はseriesの配列を参照しているので、追記用に確保した分も含めてseriesだけ数える
+                nbytes = series.nbytes
+            self.memory_usage_total += nbytes - self.memory_usage.pop(key, 0)
+            self.memory_usage[key] = nbytes
+            self.access_times[key] = time.time()
+
+            if self.memory_limit is None:
+                return
+
+            for evict_key in list(self.memory_usage.keys()):
+                if self.memory_usage_total <= self.memory_limit:
+                    break
+                if evict_key == key:
+                    continue
+                if evict_key in self.resampled_dfs:
+                    self.resampled_dfs.pop(evict_key, None)
+                elif evict_key in self.stored_keys:
+                    self.dfs.pop(evict_key, None)
+                    self.series.pop(evict_key, None)
+                    self.cold_dfs.pop(evict_key, None)
+                else:
+                    # data_dirに保存されていないものは捨てられない
+                    continue
+                self.memory_usage_total -= self.memory_usage.pop(evict_key)
+
+    # 取得用のスレッドと圧縮用のスレッドを止める (storeを作り直すときに呼ぶ)
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.cold_thread is not None:
+            self.cold_thread.join()
+        if self.fetch_loop is not None:
+            self.fetch_loop.stop()
+
+    def _run_compress_cold(self):
+        while not self.closed.wait(min(60, self.cold_after_sec)):
+            try:
+                self.compress_cold()
+            except Exception as e:
+                self.logger.error('compress_cold failed {}'.format(e))
+
+    # アクセスのないdfを圧縮する。リサンプリングしたものは作り直せるので捨てる
+    def compress_cold(self, now=None):
+        now = time.time() if now is None else now
+        with self.memory_lock:
+            keys = [
+                key for key in self.memory_usage.keys()
+                if key not in self.cold_dfs and now - self.access_times.get(key, now) >= self.cold_after_sec
+            ]
+
+        for key in keys:
+            with self._get_lock(key):
+                with self.memory_lock:
+                    if key not in self.memory_usage or now - self.access_times.get(key, now) < self.cold_after_sec:
+                        continue
+                if key in self.resampled_dfs:
+                    self.resampled_dfs.pop(key, None)
+                    nbytes = 0
+                else:
+                    df = self.dfs.get(key)
+                    if df is None:
+                        continue
+                    data = _compress_df(df)
+                    self.cold_dfs[key] = (data, _df_status(df))
+                    self.dfs.pop(key, None)
+                    self.series.pop(key, None)
+                    nbytes = len(data)
+
+                with self.memory_lock:
+                    self.memory_usage_total -= self.memory_usage.pop(key, 0)
+                    if nbytes > 0:
+                        self.memory_usage[key] = nbytes
+                        self.memory_usage_total += nbytes
+                        # 圧縮したものはLRUの先頭に置き、memory_limitを超えたら先に捨てる
+                        self.memory_usage.move_to_end(key, last=False)
+
+    def get_df_fr(self, exchange=None, market=None, force_fetch=False, start_time=None, end_time=None):
+        self.logger.info('get_df_fr {} {}'.format(exchange, market))
 
-        return df
+        source_key = self.get_fr_source_key(exchange, market)
+        if source_key is None:
+            return None
 
-    def get_df_fr(self, exchange=None, market=None, force_fetch=False):
-        self.logger.info('get_df_fr {} {}'.format(exchange, market))
+        key = source_key
 
         if exchange == 'bybit':
-            if re.search(r'\d', market):
-                return None
-
-            df_pi = self.get_df_ohlcv(exchange, market, interval=60, price_type='premium_index',
-                                      force_fetch=force_fetch)
-            df_pi = df_pi.copy().reset_index()
-            df_pi['timestamp'] = df_pi['timestamp'].dt.floor('8H')
-            df_pi = pd.concat([
-                df_pi.groupby('timestamp')['cl'].mean()
-            ], axis=1)
-            interest_rate = (0.0006 - 0.0003) / 3.0
-            df_pi['fr'] = (df_pi['cl'] + (interest_rate - df_pi['cl']).clip(-0.0005, 0.0005)).shift(2)
-            df_pi = df_pi[['fr']].dropna()
-            return df_pi
+            # 保存済みのfrをそのまま返す (premium_indexを更新したときにfrも更新される)
+            # premium_indexを読むのはfrをまだ作っていないときと、取得し直すときだけ
+            built = key in self.dfs or key in self.cold_dfs or key in self.stored_keys
+            if self.read_only or (built and not force_fetch):
+                df, _ = self._get_df(key, None)
+            else:
+                df_pi, pi_version = self._get_df_ohlcv_fetched(
+                    exchange, market, interval=60, price_type='premium_index', force_fetch=force_fetch)
+                df = self._update_bybit_fr(market, df_pi, pi_version)
+            return slice_df(df, start_time, end_time)
+
+        def fetch(df):
+            with self.fetcher_builder.fetcher(exchange=exchange, logger=self.logger) as fetcher:
+                return fetcher.fetch_fr(
+                    df=df,
+                    start_time=self.start_time,
+                    market=market,
+                )
 
-        if exchange == 'ftx' and '-PERP' not in market:
-            return None
+        df, _ = self._get_df(key, fetch, force_fetch=force_fetch, exchange=exchange, market=market)
+        return slice_df(df, start_time, end_time)
 
-        if exchange in ['binance_future', 'binance_spot', 'okex']:
+    # bybitのfrはpremium_indexから計算したものを別のキーとして保存しておく
+    # premium_indexが更新されたら、更新されうる最後の8時間足以降だけ計算し直す
+    # premium_indexの途中が変わったとき(backfill)はsinceを渡し、全体を計算し直す
+    def _update_bybit_fr(self, market, df_pi, pi_version, since=None):
+        key = _fr_key('bybit', market)
+        df = self.dfs.get(key)
+        if df is None or self.derived_versions.get(key) != pi_version:
+            with self._get_lock(key):
+                df = self._load_df(key)
+                if self.derived_versions.get(key) != pi_version:
+                    df_old = df
+                    if since is None:
+                        df = _update_bybit_fr(df_old, df_pi)
+                    else:
+                        df = _calc_bybit_fr(df_pi)
+                        since = since.floor(BYBIT_FR_PERIOD)
+                    self._publish_df(key, df_old, df, since=since)
+                    self.derived_versions[key] = pi_version
+
+        self._touch(key, df)
+        return df
+
+
+def _calc_bybit_fr(df_pi):
+    df = pd.concat([
+        df_pi['cl'].groupby(df_pi.index.floor(BYBIT_FR_PERIOD)).mean()
+    ], axis=1)
+    df['fr'] = (df['cl'] + (BYBIT_FR_INTEREST_RATE - df['cl']).clip(-0.0005, 0.0005)).shift(2)
+    return df[['fr']].dropna()
+
+
+# df_frはdf_piの古いものから計算したfr。premium_indexは末尾に追記されるだけなので、
+# frが変わりうるのは最後の足以降で、その計算には2つ前の足からのpremium_indexがあればよい
+def _update_bybit_fr(df_fr, df_pi):
+    if df_pi is None:
+        return None
+    if df_fr is None or df_fr.shape[0] == 0 or df_fr.index[0] != _bybit_fr_first_timestamp(df_pi):
+        return _calc_bybit_fr(df_pi)
+
+    last = df_fr.index[-1]
+    index = df_pi.index
+    position = index.searchsorted(last)
+    for _ in range(2):
+        if position == 0:
+            break
+        position = index.searchsorted(index[position - 1].floor(BYBIT_FR_PERIOD))
+
+    df_new = _calc_bybit_fr(df_pi.iloc[position:])
+    return pd.concat([df_fr[df_fr.index < last], df_new[last <= df_new.index]])
+
+
+# frの最初の足 (shift(2)で最初の2つの足は値がない)
+def _bybit_fr_first_timestamp(df_pi):
+    index = df_pi.index
+    position = 0
+    for _ in range(2):
+        if position >= len(index):
             return None
+        position = index.searchsorted(index[position].floor(BYBIT_FR_PERIOD) + BYBIT_FR_PERIOD)
+    if position >= len(index):
+        return None
+    return index[position].floor(BYBIT_FR_PERIOD)
 
-        key = _fr_key(exchange, market)
-        fetcher = self.fetcher_builder.create_fetcher(exchange=exchange, logger=self.logger)
 
-        with self._get_lock(key):
-            df = self.dfs.get(key)
+def _resample_ohlcv(df, base_interval=None, interval=None, start_time=None):
+    aggs = {}
+    for col in df.columns:
+        # 出来高系はsum
+        aggs[col] = RESAMPLE_AGGS.get(col, 'sum')
 
-            if force_fetch or df is None:
-                df = fetcher.fetch_fr(
-                    df=df,
-                    start_time=self.start_time,
-                    market=market,
-                )
+    df_resampled = df.groupby(df.index.floor(pd.to_timedelta(interval, unit='s'))).agg(aggs)
 
-                self.dfs[key] = df
+    # 取引所から取得した場合と同じく、未確定の足と期間が欠けた先頭の足は除く
+    end = df.index.max() + pd.to_timedelta(base_interval, unit='s')
+    df_resampled = df_resampled[df_resampled.index + pd.to_timedelta(interval, unit='s') <= end]
+    if start_time is not None:
+        df_resampled = df_resampled[pd.to_datetime(start_time, unit='s', utc=True) <= df_resampled.index]
 
-            if df is not None:
-                df = df.copy()
+    return df_resampled
 
-        if self.data_dir is not None and df is not None:
-            _df_save_atomic(df, os.path.join(self.data_dir, key + '.parquet'))
 
-        return df
+# intervalの足を作るために取得(保存)する足
+def _ohlcv_fetch_interval(interval, min_interval=None):
+    # 日足の境界をまたがない足だけ合成する (週足などは取引所ごとに揃え方が違う)
+    if interval is None or 86400 % interval != 0:
+        return interval
+
+    for base_interval in RESAMPLE_BASE_INTERVALS:
+        if min_interval is not None and base_interval < min_interval:
+            continue
+        if base_interval <= interval and interval % base_interval == 0:
+            return base_interval
 
+    return interval
+
+
+# start_time <= timestamp < end_time の範囲を二分探索で切り出す (dfはtimestamp順)
+def slice_df(df, start_time=None, end_time=None):
+    if df is None or (start_time is None and end_time is None):
+        return df
 
-def _df_save_atomic(df, path):
-    with tempfile.TemporaryDirectory() as dname:
-        tmp_path = os.path.join(dname, 'tmp.parquet')
-        df.to_parquet(tmp_path)
-        os.rename(tmp_path, path)
+    start = 0
+    end = df.shape[0]
+    if start_time is not None:
+        start = df.index.searchsorted(pd.to_datetime(start_time, unit='s', utc=True), side='left')
+    if end_time is not None:
+        end = df.index.searchsorted(pd.to_datetime(end_time, unit='s', utc=True), side='left')
+    return df.iloc[start:max(start, end)]
+
+
+def _find_gaps(df, interval, min_gap_bars=GAP_MIN_BARS, confirmed=None):
+    if df is None or df.shape[0] < 2:
+        return []
+    timestamps = df.index.values.astype('datetime64[s]').astype(np.int64)
+    diffs = np.diff(timestamps)
+    gaps = []
+    for i in np.flatnonzero(diffs >= interval * (min_gap_bars + 1)):
+        start = int(timestamps[i]) + interval
+        end = int(timestamps[i + 1])
+        if confirmed is not None and (start, end) in confirmed:
+            continue
+        gaps.append((start, end, (end - start) // interval))
+    return gaps
+
+
+def _compress_df(df):
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df)
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _decompress_df(data):
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+def _df_status(df):
+    if df is None:
+        return None
+    return {
+        'count': df.shape[0],
+        'min_timestamp': df.index.min().isoformat(),
+        'max_timestamp': df.index.max().isoformat(),
+    }
+
+
+def _df_equals_tail(df_old, df):
+    # fetcherは末尾に追記するだけなので、件数と最後の行が同じなら変化なしとみなす
+    if df_old is None or df is None:
+        return df_old is df
+    if df_old is df:
+        return True
+    if df_old.shape != df.shape:
+        return False
+    if df.shape[0] == 0:
+        return True
+    return df_old.index[-1] == df.index[-1] and df_old.iloc[-1].equals(df.iloc[-1])
+
+
+def _df_changed_since(df_old, df):
+    # 保存済みの最後の行以降だけ書き直せばよい (最後の足は更新されることがある)
+    if df_old is None or df_old.shape[0] == 0 or df.shape[0] == 0:
+        return None
+    if df_old.index[0] != df.index[0]:
+        return None
+    return df_old.index[-1]
+
+
+def _parse_ohlcv_key(key):
+    m = re.match(r'^ohlcv,exchange=(.+),market=(.+),interval=(\d+),price_type=(.+)$', key)
+    if m is None:
+        return None
+    price_type = None if m.group(4) == 'None' else m.group(4)
+    return m.group(1), m.group(2), int(m.group(3)), price_type
 
 
 def _ohlcv_key(exchange, market, interval, price_type):
@@ -1,30 +1,28 @@
-import threading
 import time
 import traceback
-import ccxt
+from store_warmup_scheduler import WarmupTask
 
 class StoreWarpupBinanceFuture:
+    exchange = 'binance_future'
+
     def __init__(self, store=None, logger=None, min_interval=None):
         self.store = store
         self.logger = logger
         self.min_interval = min_interval
 
-    def start(self):
-        self.thread = threading.Thread(target=self._run)
-        self.thread.start()
-
-    def _run(self):
-        while True:
-            time.sleep(60)
+    def _loop(self, raise_error=False):
+        for task in self.list_tasks():
             try:
-                self._loop()
+                task.run(self.store)
             except KeyboardInterrupt:
                 raise
             except Exception as e:
+                if raise_error:
+                    raise
                 self.logger.error('exception ' + traceback.format_exc())
                 time.sleep(60)
 
-    def _loop(self, raise_error=False):
+    def list_tasks(self):
         # https://binance-docs.github.io/apidocs/futures/en/#public-endpoints-info
         intervals = [
             60,
@@ -45,29 +43,25 @@ class StoreWarpupBinanceFuture:
             None,
         ]
 
-        binance = ccxt.binance()
-        markets = binance.fapiPublicGetExchangeInfo()['symbols']
+        intervals = [x for x in intervals if self.min_interval is None or x >= self.min_interval]
+        intervals = sorted(set(map(self.store.get_ohlcv_fetch_interval, intervals)))
+
+        with self.store.fetcher_builder.ccxt_client('binance_future') as binance:
+            markets = binance.fapiPublicGetExchangeInfo()['symbols']
         markets = list(filter(lambda x: x['contractType'] == 'PERPETUAL', markets))
+        # SETTLING, CLOSEなど取引されていない市場はsealする
+        for market in markets:
+            self.store.set_sealed(self.exchange, market['symbol'], market.get('status', 'TRADING') != 'TRADING')
         markets = list(map(lambda x: x['symbol'], markets))
 
+        tasks = []
         for symbol in markets:
             for interval in intervals:
-                if self.min_interval is not None and interval < self.min_interval:
-                    continue
-
                 for price_type in price_types:
-                    try:
-                        self.store.get_df_ohlcv(
-                            exchange='binance_future',
-                            market=symbol,
-                            interval=interval,
-                            price_type=price_type,
-                            force_fetch=True
-                        )
-                    except KeyboardInterrupt:
-                        raise
-                    except Exception as e:
-                        if raise_error:
-                            raise
-                        self.logger.error('exception ' + traceback.format_exc())
-                        time.sleep(60)
+                    tasks.append(WarmupTask(
+                        exchange=self.exchange,
+                        market=symbol,
+                        interval=interval,
+                        price_type=price_type,
+                    ))
+        return tasks
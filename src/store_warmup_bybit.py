@@ -1,31 +1,29 @@
 import re
-import threading
 import time
 import traceback
-import ccxt
+from store_warmup_scheduler import WarmupTask
 
 class StoreWarpupBybit:
+    exchange = 'bybit'
+
     def __init__(self, store=None, logger=None, min_interval=None):
         self.store = store
         self.logger = logger
         self.min_interval = min_interval
 
-    def start(self):
-        self.thread = threading.Thread(target=self._run)
-        self.thread.start()
-
-    def _run(self):
-        while True:
-            time.sleep(60)
+    def _loop(self, raise_error=False):
+        for task in self.list_tasks():
             try:
-                self._loop()
+                task.run(self.store)
             except KeyboardInterrupt:
                 raise
             except Exception as e:
+                if raise_error:
+                    raise
                 self.logger.error('exception ' + traceback.format_exc())
                 time.sleep(60)
 
-    def _loop(self, raise_error=False):
+    def list_tasks(self):
         intervals = [
             60,
             3 * 60,
@@ -47,10 +45,21 @@ class StoreWarpupBybit:
             'premium_index',
         ]
 
-        bybit = ccxt.bybit()
-        symbols = bybit.v2PublicGetSymbols()['result']
+        # 合成できる足は元になる足だけ取得すればよい (Store側でリサンプリングする)
+        fetch_intervals = set(
+            self.store.get_ohlcv_fetch_interval(x)
+            for x in intervals
+            if self.min_interval is None or x >= self.min_interval
+        )
+        intervals = sorted(fetch_intervals | {60})
+
+        with self.store.fetcher_builder.ccxt_client('bybit') as bybit:
+            symbols = bybit.v2PublicGetSymbols()['result']
+        for symbol in symbols:
+            self.store.set_sealed(self.exchange, symbol['name'], symbol.get('status', 'Trading') != 'Trading')
         symbols = map(lambda x: x['name'], symbols)
 
+        tasks = []
         for symbol in symbols:
             # 期限付き先物は未対応
             if re.search(r'\d', symbol):
@@ -58,23 +67,12 @@ class StoreWarpupBybit:
             for interval in intervals:
                 for price_type in price_types:
                     is_premium_index_minute = price_type == 'premium_index' and interval == 60 # fr計算に必要
-                    if self.min_interval is not None and interval < self.min_interval and not is_premium_index_minute:
+                    if interval not in fetch_intervals and not is_premium_index_minute:
                         continue
-                    try:
-                        self.store.get_df_ohlcv(
-                            exchange='bybit',
-                            market=symbol,
-                            interval=interval,
-                            price_type=price_type,
-                            force_fetch=True
-                        )
-                    except KeyboardInterrupt:
-                        raise
-                    except Exception as e:
-                        if raise_error:
-                            raise
-                        self.logger.error('exception ' + traceback.format_exc())
-                        time.sleep(60)
-
-
-
+                    tasks.append(WarmupTask(
+                        exchange=self.exchange,
+                        market=symbol,
+                        interval=interval,
+                        price_type=price_type,
+                    ))
+        return tasks
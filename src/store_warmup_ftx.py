@@ -1,30 +1,28 @@
-import threading
 import time
 import traceback
-import ccxt
+from store_warmup_scheduler import WarmupTask
 
 class StoreWarpupFtx:
+    exchange = 'ftx'
+
     def __init__(self, store=None, logger=None, min_interval=None):
         self.store = store
         self.logger = logger
         self.min_interval = min_interval
 
-    def start(self):
-        self.thread = threading.Thread(target=self._run)
-        self.thread.start()
-
-    def _run(self):
-        while True:
-            time.sleep(60)
+    def _loop(self, raise_error=False):
+        for task in self.list_tasks():
             try:
-                self._loop()
+                task.run(self.store)
             except KeyboardInterrupt:
                 raise
             except Exception as e:
+                if raise_error:
+                    raise
                 self.logger.error('exception ' + traceback.format_exc())
                 time.sleep(60)
 
-    def _loop(self, raise_error=False):
+    def list_tasks(self):
         intervals = [
             15,
             60,
@@ -40,47 +38,36 @@ class StoreWarpupFtx:
             'index',
         ]
 
-        ftx = ccxt.ftx()
-        markets = list(map(lambda x: x['name'], ftx.publicGetMarkets()['result']))
-        current_futures = list(map(lambda x: x['name'], ftx.publicGetFutures()['result']))
-        expired_futures = list(map(lambda x: x['name'], ftx.publicGetExpiredFutures()['result']))
+        intervals = [x for x in intervals if self.min_interval is None or x >= self.min_interval]
+        intervals = sorted(set(map(self.store.get_ohlcv_fetch_interval, intervals)))
+
+        with self.store.fetcher_builder.ccxt_client('ftx') as ftx:
+            markets = list(map(lambda x: x['name'], ftx.publicGetMarkets()['result']))
+            current_futures = list(map(lambda x: x['name'], ftx.publicGetFutures()['result']))
+            expired_futures = list(map(lambda x: x['name'], ftx.publicGetExpiredFutures()['result']))
         unique_symbols = list(set(markets + current_futures + expired_futures))
 
+        # 満期になった先物のデータはもう変わらない
+        for symbol in expired_futures:
+            self.store.seal_market(self.exchange, symbol)
+
+        tasks = []
         for symbol in unique_symbols:
             for interval in intervals:
-                if self.min_interval is not None and interval < self.min_interval:
-                    continue
-
                 for price_type in price_types:
                     if price_type == 'index' and '-PERP' not in symbol:
                         continue
-                    try:
-                        self.store.get_df_ohlcv(
-                            exchange='ftx',
-                            market=symbol,
-                            interval=interval,
-                            price_type=price_type,
-                            force_fetch=True
-                        )
-                    except KeyboardInterrupt:
-                        raise
-                    except Exception as e:
-                        if raise_error:
-                            raise
-                        self.logger.error('exception ' + traceback.format_exc())
-                        time.sleep(60)
-
-            try:
-                if symbol in (current_futures + expired_futures):
-                    self.store.get_df_fr(
-                        exchange='ftx',
+                    tasks.append(WarmupTask(
+                        exchange=self.exchange,
                         market=symbol,
-                        force_fetch=True
-                    )
-            except KeyboardInterrupt:
-                raise
-            except Exception as e:
-                if raise_error:
-                    raise
-                self.logger.error('exception ' + traceback.format_exc())
-                time.sleep(60)
+                        interval=interval,
+                        price_type=price_type,
+                    ))
+
+            if symbol in (current_futures + expired_futures):
+                tasks.append(WarmupTask(
+                    exchange=self.exchange,
+                    market=symbol,
+                    fr=True,
+                ))
+        return tasks
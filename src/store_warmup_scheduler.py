@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class WarmupTask:
+    __slots__ = ['exchange', 'market', 'interval', 'price_type', 'fr']
+
+    def __init__(self, exchange=None, market=None, interval=None, price_type=None, fr=False):
+        self.exchange = exchange
+        self.market = market
+        self.interval = interval
+        self.price_type = price_type
+        self.fr = fr
+
+    @property
+    def key(self):
+        if self.fr:
+            return 'fr,exchange={},market={}'.format(self.exchange, self.market)
+        return 'ohlcv,exchange={},market={},interval={},price_type={}'.format(
+            self.exchange, self.market, self.interval, self.price_type)
+
+    def run(self, store):
+        if self.fr:
+            store.get_df_fr(
+                exchange=self.exchange,
+                market=self.market,
+                force_fetch=True
+            )
+        else:
+            store.get_df_ohlcv(
+                exchange=self.exchange,
+                market=self.market,
+                interval=self.interval,
+                price_type=self.price_type,
+                force_fetch=True
+            )
+
+
+# アクセスの多いキーは短い間隔で、少ないキーは長い間隔で更新する
+# idle_expiry_secを超えてアクセスのないキー(一度もアクセスのないキーを含む)は更新しない
+# access_trackerがなければ全キーをhot_refresh_sec間隔で更新する
+class WarmupPolicy:
+    def __init__(self, access_tracker=None, hot_refresh_sec=60, cold_refresh_sec=None,
+                 hot_window_sec=60 * 60, idle_expiry_sec=None):
+        self.access_tracker = access_tracker
+        self.hot_refresh_sec = hot_refresh_sec
+        self.cold_refresh_sec = hot_refresh_sec if cold_refresh_sec is None else cold_refresh_sec
+        self.hot_window_sec = hot_window_sec
+        self.idle_expiry_sec = idle_expiry_sec
+
+    # 次の更新までの秒数。Noneなら更新しない
+    def refresh_interval(self, task, now):
+        if self.access_tracker is None:
+            return self.hot_refresh_sec
+
+        access = self.access_tracker.get(task.exchange, task.market)
+        idle_sec = None if access is None else now - access['last_access']
+        if idle_sec is not None and idle_sec <= self.hot_window_sec:
+            return self.hot_refresh_sec
+        if self.idle_expiry_sec is not None and (idle_sec is None or idle_sec > self.idle_expiry_sec):
+            return None
+        return self.cold_refresh_sec
+
+
+class _TaskState:
+    __slots__ = ['task', 'next_run', 'failures', 'last_success', 'in_flight', 'idle', 'final']
+
+    def __init__(self, task):
+        self.task = task
+        self.next_run = 0
+        self.failures = 0
+        self.last_success = None
+        self.in_flight = False
+        self.idle = False
+        self.final = False
+
+
+class _ExchangeState:
+    def __init__(self, warmup):
+        self.warmup = warmup
+        self.tasks = {}
+        self.heap = []
+        self.cond = threading.Condition()
+        self.cycle_started_at = time.time()
+        self.cycle_pending = set()
+        self.last_cycle_sec = None
+        self.last_discovery_at = None
+
+
+# 取引所ごとにworkerを複数立てて、rate limitの枠を使い切るようにタスクを流す
+# 古いものから順に更新し、失敗したキーだけ指数的に間隔を空ける
+# 更新間隔はpolicyで決める。heapの時刻は「次に確認する時刻」で、取り出した時点で更新するか判断する
+class StoreWarmupScheduler:
+    def __init__(self, store=None, logger=None, warmups=None, workers=4, policy=None,
+                 refresh_interval=60, discovery_interval=60 * 60,
+                 backoff_base=60, max_backoff=60 * 60, idle_check_interval=60):
+        self.store = store
+        self.logger = logger
+        self.workers = workers
+        self.policy = WarmupPolicy(hot_refresh_sec=refresh_interval) if policy is None else policy
+        self.idle_check_interval = idle_check_interval
+        self.discovery_interval = discovery_interval
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.states = dict((warmup.exchange, _ExchangeState(warmup)) for warmup in warmups)
+        self.seq = itertools.count()
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for exchange, state in self.states.items():
+            threads = [threading.Thread(target=self._run_discovery, args=(state,), name='warmup-discovery-' + exchange)]
+            for i in range(self.workers):
+                threads.append(threading.Thread(target=self._run_worker, args=(state,), name='warmup-{}-{}'.format(exchange, i)))
+            for thread in threads:
+                thread.start()
+            self.threads += threads
+
+    def stop(self):
+        self.stopped.set()
+        for state in self.states.values():
+            with state.cond:
+                state.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def status(self):
+        now = time.time()
+        status = {}
+        for exchange, state in self.states.items():
+            with state.cond:
+                task_states = list(state.tasks.values())
+                last_successes = [x.last_success for x in task_states if x.last_success is not None]
+                status[exchange] = {
+                    'tasks': len(task_states),
+                    'due': len([x for x in task_states if not x.in_flight and x.next_run <= now]),
+                    'in_flight': len([x for x in task_states if x.in_flight]),
+                    'idle': len([x for x in task_states if x.idle]),
+                    'final': len([x for x in task_states if x.final]),
+                    'failing': len([x for x in task_states if x.failures > 0]),
+                    'never_fetched': len(task_states) - len(last_successes),
+                    'max_lag_sec': now - min(last_successes) if len(last_successes) > 0 else None,
+                    'last_cycle_sec': state.last_cycle_sec,
+                    'current_cycle_pending': len(state.cycle_pending),
+                    'last_discovery_at': state.last_discovery_at,
+                }
+        return status
+
+    def update_tasks(self, exchange, tasks):
+        state = self.states[exchange]
+        with state.cond:
+            now = time.time()
+            new_tasks = {}
+            finals = []
+            for task in tasks:
+                task_state = state.tasks.get(task.key)
+                if task_state is None:
+                    task_state = _TaskState(task)
+                    self._push(state, task_state)
+                elif not task_state.in_flight:
+                    # unsealされたキーは再び更新する
+                    final = self.store.is_final(task.key)
+                    if task_state.final and not final:
+                        task_state.next_run = now
+                        self._push(state, task_state)
+                    task_state.final = final
+                    if final:
+                        finals.append(task.key)
+                new_tasks[task.key] = task_state
+            state.tasks = new_tasks
+            state.cycle_pending &= set(new_tasks.keys())
+            if len(state.cycle_pending) == 0:
+                self._start_cycle(state, now)
+            for key in finals:
+                self._finish_in_cycle(state, key, now)
+            state.last_discovery_at = now
+            state.cond.notify_all()
+
+    def _run_discovery(self, state):
+        while not self.stopped.is_set():
+            try:
+                self.update_tasks(state.warmup.exchange, state.warmup.list_tasks())
+                wait = self.discovery_interval
+            except Exception as e:
+                self.logger.error('exception ' + traceback.format_exc())
+                wait = 60
+            self.stopped.wait(wait)
+
+    def _run_worker(self, state):
+        while not self.stopped.is_set():
+            task_state = self._pop_due(state)
+            if task_state is None:
+                continue
+
+            try:
+                task_state.task.run(self.store)
+                success = True
+            except Exception as e:
+                self.logger.error('exception {} {}'.format(task_state.task.key, traceback.format_exc()))
+                success = False
+
+            now = time.time()
+            with state.cond:
+                task_state.in_flight = False
+                if success:
+                    task_state.failures = 0
+                    task_state.last_success = now
+                    task_state.next_run = now + self.policy.hot_refresh_sec
+                    # sealされた市場のキーは取得済みなら二度と更新しない
+                    task_state.final = self.store.is_final(task_state.task.key)
+                else:
+                    task_state.failures += 1
+                    task_state.next_run = now + min(
+                        self.max_backoff,
+                        self.backoff_base * 2 ** (task_state.failures - 1)
+                    )
+
+                self._finish_in_cycle(state, task_state.task.key, now)
+
+                # discoveryで消されたタスクは戻さない
+                if state.tasks.get(task_state.task.key) is task_state and not task_state.final:
+                    self._push(state, task_state)
+                    state.cond.notify()
+
+    def _pop_due(self, state):
+        with state.cond:
+            while not self.stopped.is_set():
+                now = time.time()
+                while len(state.heap) > 0:
+                    next_run, _, task_state = state.heap[0]
+                    if state.tasks.get(task_state.task.key) is not task_state or next_run != task_state.next_run:
+                        heapq.heappop(state.heap)
+                        continue
+                    break
+
+                if len(state.heap) == 0:
+                    state.cond.wait(1)
+                    continue
+
+                next_run, _, task_state = state.heap[0]
+                if next_run > now:
+                    state.cond.wait(min(1, next_run - now))
+                    continue
+
+                heapq.heappop(state.heap)
+
+                if task_state.failures == 0:
+                    refresh_interval = self.policy.refresh_interval(task_state.task, now)
+                    task_state.idle = refresh_interval is None
+                    if refresh_interval is None:
+                        task_state.next_run = now + self.idle_check_interval
+                        # 更新しないので、この周は済んだものとする
+                        self._finish_in_cycle(state, task_state.task.key, now)
+                    elif task_state.last_success is not None and now < task_state.last_success + refresh_interval:
+                        task_state.next_run = min(
+                            task_state.last_success + refresh_interval,
+                            now + self.idle_check_interval
+                        )
+                    if task_state.next_run > now:
+                        self._push(state, task_state)
+                        continue
+
+                task_state.in_flight = True
+                return task_state
+        return None
+
+    def _push(self, state, task_state):
+        heapq.heappush(state.heap, (task_state.next_run, next(self.seq), task_state))
+
+    # 更新しないキー(final, idle)は1周に含めない
+    def _start_cycle(self, state, now):
+        state.cycle_started_at = now
+        state.cycle_pending = set(key for key, x in state.tasks.items() if not x.final and not x.idle)
+
+    def _finish_in_cycle(self, state, key, now):
+        if key not in state.cycle_pending:
+            return
+        state.cycle_pending.discard(key)
+        if len(state.cycle_pending) == 0:
+            state.last_cycle_sec = now - state.cycle_started_at
+            self._start_cycle(state, now)
@@ -0,0 +1,21 @@
+import os
+import sys
+from unittest import TestCase
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from access_tracker import AccessTracker
+
+
+class TestAccessTracker(TestCase):
+    def test_record(self):
+        tracker = AccessTracker()
+        self.assertIsNone(tracker.get('bybit', 'BTCUSD'))
+
+        tracker.record('bybit', 'BTCUSD', now=1)
+        tracker.record('bybit', 'BTCUSD', now=2)
+        tracker.record('bybit', 'ETHUSD', now=3)
+
+        self.assertEqual(tracker.get('bybit', 'BTCUSD'), {'count': 2, 'last_access': 2})
+        status = tracker.status()
+        self.assertEqual(status['count'], 2)
+        self.assertEqual(status['top'][0]['market'], 'BTCUSD')
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import zipfile
+from unittest import TestCase
+import click
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from bulk_import import group_files, import_key, read_binance_klines, read_ohlcv_file
+from partitioned_storage import PartitionedStorage
+from store import _ohlcv_key
+
+
+def _binance_kline_csv(start, periods, header=False):
+    lines = []
+    if header:
+        lines.append('open_time,open,high,low,close,volume,close_time,quote_volume,count,'
+                     'taker_buy_volume,taker_buy_quote_volume,ignore')
+    start_ms = int(pd.Timestamp(start, tz='UTC').timestamp() * 1000)
+    for i in range(periods):
+        t = start_ms + i * 60000
+        lines.append('{},{},{},{},{},1.5,{},100,10,0.5,50,0'.format(t, i, i + 10, i - 10, i + 1, t + 59999))
+    return '\n'.join(lines) + '\n'
+
+
+class TestBulkImport(TestCase):
+    def test_read_binance_klines(self):
+        with tempfile.TemporaryDirectory() as dname:
+            path = os.path.join(dname, 'BTCUSDT-1m-2021-01.zip')
+            with zipfile.ZipFile(path, 'w') as z:
+                z.writestr('BTCUSDT-1m-2021-01.csv', _binance_kline_csv('2021-01-01 00:00:00', 3))
+            df = read_binance_klines(path)
+            self.assertEqual(list(df.columns), ['op', 'hi', 'lo', 'cl', 'volume'])
+            self.assertEqual(df.index[0], pd.Timestamp('2021-01-01 00:00:00', tz='UTC'))
+            self.assertEqual(df['hi'].tolist(), [10, 11, 12])
+
+            path = os.path.join(dname, 'BTCUSDT-1m-2021-02.csv')
+            with open(path, 'w') as f:
+                f.write(_binance_kline_csv('2021-02-01 00:00:00', 2, header=True))
+            df = read_binance_klines(path)
+            self.assertEqual(df.shape[0], 2)
+            self.assertEqual(df.index[1], pd.Timestamp('2021-02-01 00:01:00', tz='UTC'))
+
+    def test_read_ohlcv_file(self):
+        with tempfile.TemporaryDirectory() as dname:
+            path = os.path.join(dname, 'ohlcv.csv')
+            with open(path, 'w') as f:
+                f.write('timestamp,op,hi,lo,cl,volume\n1609459200,1,2,0,1.5,10\n1609459260,1.5,2,1,2,5\n')
+            df = read_ohlcv_file(path)
+            self.assertEqual(df.index[1], pd.Timestamp('2021-01-01 00:01:00', tz='UTC'))
+            self.assertEqual(df['cl'].tolist(), [1.5, 2])
+
+    def test_import_key(self):
+        with tempfile.TemporaryDirectory() as dname:
+            data_dir = os.path.join(dname, 'store')
+            key = _ohlcv_key('binance_future', 'BTCUSDT', 60, None)
+            paths = []
+            for month, periods in [('01', 3), ('02', 2)]:
+                path = os.path.join(dname, 'BTCUSDT-1m-2021-{}.csv'.format(month))
+                with open(path, 'w') as f:
+                    f.write(_binance_kline_csv('2021-{}-01 00:00:00'.format(month), periods))
+                paths.append(path)
+
+            self.assertEqual(import_key(data_dir, key, paths[:1], True), (key, 3))
+            # 保存済みの足は残して、新しい足だけ加える
+            self.assertEqual(import_key(data_dir, key, paths, True), (key, 2))
+            self.assertEqual(import_key(data_dir, key, paths, True), (key, 0))
+
+            storage = PartitionedStorage(data_dir)
+            df = storage.load(key)
+            self.assertEqual(df.shape[0], 5)
+            self.assertEqual(sorted(storage.read_manifest(key)['partitions'].keys()), ['202101', '202102'])
+
+    def test_group_files(self):
+        with tempfile.TemporaryDirectory() as dname:
+            for name in ['BTCUSDT-1m-2021-01.csv', 'BTCUSDT-1h-2021-01.csv', 'ohlcv.csv']:
+                with open(os.path.join(dname, name), 'w') as f:
+                    f.write('')
+
+            # storeが読まない足のアーカイブは読み飛ばす
+            groups, binance_keys = group_files([os.path.join(dname, 'BTCUSDT-1m-2021-01.csv'),
+                                                os.path.join(dname, 'BTCUSDT-1h-2021-01.csv')], 'binance_future')
+            key = _ohlcv_key('binance_future', 'BTCUSDT', 60, None)
+            self.assertEqual(dict(groups), {key: [os.path.join(dname, 'BTCUSDT-1m-2021-01.csv')]})
+            self.assertEqual(binance_keys, {key})
+
+            path = os.path.join(dname, 'ohlcv.csv')
+            with self.assertRaises(click.UsageError):
+                group_files([path], 'ftx', market='BTC-PERP', interval=3600)
+            groups, _ = group_files([path], 'ftx', market='BTC-PERP', interval=3600, min_interval=3600)
+            self.assertEqual(list(groups.keys()), [_ohlcv_key('ftx', 'BTC-PERP', 3600, None)])
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from columnar_series import ColumnarSeries
+
+
+def _make_df(start, periods, value=0):
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=periods, freq='1min', tz='UTC'),
+        'op': np.arange(periods, dtype=float) + value,
+        'cl': np.arange(periods, dtype=float) + value + 1,
+    })
+    return df.set_index('timestamp')
+
+
+class TestColumnarSeries(TestCase):
+    def test_update(self):
+        series = ColumnarSeries.from_df(_make_df('2021-01-01 00:00:00', 10))
+        df = series.to_df()
+        self.assertTrue(np.shares_memory(df['op'].to_numpy(), series.values))
+        self.assertTrue(np.shares_memory(df.index.asi8, series.timestamps))
+        self.assertEqual(str(df.index.tz), 'UTC')
+
+        # 最後の足が変わったら新しい領域に作り直し、返したdfは変わらない
+        values = series.values
+        series.update(_make_df('2021-01-01 00:09:00', 5, value=100))
+        self.assertEqual(len(series), 14)
+        self.assertIsNot(series.values, values)
+        self.assertEqual(series.to_df()['op'].tolist(), list(range(9)) + [100, 101, 102, 103, 104])
+        self.assertEqual(df['op'].tolist(), list(range(10)))
+
+        # 重なる足が同じなら確保済みの領域に追記するだけ
+        df = series.to_df()
+        values = series.values
+        series.update(pd.concat([df.iloc[-1:], _make_df('2021-01-01 00:14:00', 1, value=200)]))
+        self.assertIs(series.values, values)
+        self.assertEqual(len(series), 15)
+        self.assertEqual(series.to_df().index[-1], pd.Timestamp('2021-01-01 00:14:00', tz='UTC'))
+        self.assertEqual(df.shape[0], 14)
+        self.assertEqual(df['op'].iloc[-1], 104)
+
+        # 足が一致しなければ作り直す
+        df = series.to_df()
+        series.update(_make_df('2021-01-01 00:13:30', 2, value=300))
+        self.assertIsNot(series.values, values)
+        self.assertEqual(len(series), 16)
+        self.assertEqual(series.to_df()['op'].tolist()[-3:], [104, 300, 301])
+        self.assertEqual(df['op'].tolist()[-2:], [104, 200])
+
+    def test_supports(self):
+        self.assertTrue(ColumnarSeries.supports(_make_df('2021-01-01 00:00:00', 3)))
+        df = _make_df('2021-01-01 00:00:00', 3)
+        df['count'] = 1
+        self.assertFalse(ColumnarSeries.supports(df))
+        self.assertFalse(ColumnarSeries.supports(None))
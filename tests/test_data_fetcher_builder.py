@@ -35,3 +35,25 @@ class TestDataFetcherBuilder(TestCase):
         builder = DataFetcherBuilder()
         fetcher = builder.create_fetcher(exchange='okex')
         self.assertIsInstance(fetcher, OkexFetcher)
+
+    def test_fetcher_pool(self):
+        builder = DataFetcherBuilder()
+        with builder.fetcher(exchange='bybit') as fetcher:
+            self.assertIsInstance(fetcher, BybitFetcher)
+        with builder.fetcher(exchange='bybit') as fetcher2:
+            self.assertIs(fetcher2, fetcher)
+            with builder.fetcher(exchange='bybit') as fetcher3:
+                self.assertIsNot(fetcher3, fetcher)
+
+        status = builder.status()
+        self.assertEqual(status['bybit']['hits'], 1)
+        self.assertEqual(status['bybit']['misses'], 2)
+        self.assertEqual(status['bybit']['in_use'], 0)
+        self.assertEqual(status['bybit']['idle'], 2)
+
+    def test_ccxt_client_pool(self):
+        builder = DataFetcherBuilder()
+        with builder.ccxt_client('binance_future') as client:
+            pass
+        with builder.ccxt_client('binance_future') as client2:
+            self.assertIs(client2, client)
@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+import time
+from unittest import TestCase
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from fetch_loop import FetchLoop
+
+
+class TestFetchLoop(TestCase):
+    def test_run(self):
+        loop = FetchLoop()
+        self.assertEqual(loop.run('bybit', lambda x: x + 1, 1), 2)
+
+        def fail():
+            raise ValueError('error')
+
+        with self.assertRaises(ValueError):
+            loop.run('bybit', fail)
+        loop.stop()
+
+    def test_max_concurrency(self):
+        loop = FetchLoop(max_concurrency=2)
+        lock = threading.Lock()
+        running = {'bybit': 0, 'ftx': 0}
+        max_running = {'bybit': 0, 'ftx': 0}
+
+        def fetch(exchange):
+            with lock:
+                running[exchange] += 1
+                max_running[exchange] = max(max_running[exchange], running[exchange])
+            time.sleep(0.05)
+            with lock:
+                running[exchange] -= 1
+
+        futures = [loop.submit(exchange, fetch, exchange) for exchange in ['bybit', 'ftx'] for _ in range(6)]
+        time.sleep(0.02)
+        status = loop.status()
+        for future in futures:
+            future.result()
+
+        self.assertEqual(max_running, {'bybit': 2, 'ftx': 2})
+        self.assertEqual(status['bybit']['in_flight'] + status['bybit']['waiting'], 6)
+        self.assertEqual(loop.status()['bybit'], {'in_flight': 0, 'waiting': 0})
+        loop.stop()
@@ -0,0 +1,49 @@
+import os
+import sys
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from panel import align_long, timestamp_grid, to_wide
+
+
+def _make_table(market, start, periods):
+    index = pd.date_range(start, periods=periods, freq=pd.to_timedelta(3600, unit='s'), tz='UTC', name='timestamp')
+    df = pd.DataFrame({'cl': np.arange(periods, dtype=np.float64)}, index=index)
+    df.index = pd.MultiIndex(
+        levels=[[market], df.index],
+        codes=[np.zeros(periods, dtype=np.int64), np.arange(periods)],
+        names=['market', 'timestamp'],
+    )
+    return pa.Table.from_pandas(df)
+
+
+class TestPanel(TestCase):
+    def setUp(self):
+        self.tables = [
+            _make_table('BTC-PERP', '2021-01-01 00:00:00', 3),
+            _make_table('ETH-PERP', '2021-01-01 01:00:00', 3),
+        ]
+        self.markets = ['BTC-PERP', 'ETH-PERP']
+
+    def test_timestamp_grid(self):
+        self.assertEqual(len(timestamp_grid(self.tables, 'outer')), 4)
+        self.assertEqual(len(timestamp_grid(self.tables, 'inner')), 2)
+
+    def test_align_long(self):
+        grid = timestamp_grid(self.tables, 'outer')
+        df = pa.concat_tables(align_long(self.tables, self.markets, grid)).to_pandas()
+
+        self.assertEqual(df.shape[0], 8)
+        self.assertEqual(df.loc['ETH-PERP']['cl'].tolist()[1:], [0.0, 1.0, 2.0])
+        self.assertTrue(np.isnan(df.loc['ETH-PERP']['cl'].iloc[0]))
+
+    def test_to_wide(self):
+        grid = timestamp_grid(self.tables, 'inner')
+        df = to_wide(self.tables, self.markets, grid).to_pandas()
+
+        self.assertEqual(df.shape, (2, 2))
+        self.assertEqual(df[('cl', 'BTC-PERP')].tolist(), [1.0, 2.0])
+        self.assertEqual(df[('cl', 'ETH-PERP')].tolist(), [0.0, 1.0])
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from partitioned_storage import PartitionedStorage
+
+KEY = 'ohlcv,exchange=bybit,market=BTCUSD,interval=3600,price_type=None'
+
+
+def _make_df(start, periods):
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=periods, freq=pd.to_timedelta(1, unit='h'), tz='UTC'),
+        'cl': np.arange(periods, dtype=float),
+    })
+    return df.set_index('timestamp')
+
+
+class TestPartitionedStorage(TestCase):
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as dname:
+            storage = PartitionedStorage(dname)
+            df = _make_df('2021-01-31 00:00:00', 48)
+            storage.save(KEY, df)
+
+            self.assertEqual(storage.keys(), [KEY])
+            self.assertEqual(sorted(storage.read_manifest(KEY)['partitions'].keys()), ['202101', '202102'])
+            pd.testing.assert_frame_equal(storage.load(KEY), df)
+
+    def test_save_since(self):
+        with tempfile.TemporaryDirectory() as dname:
+            storage = PartitionedStorage(dname)
+            df = _make_df('2021-01-01 00:00:00', 24 * 40)
+            storage.save(KEY, df)
+            jan_path = os.path.join(dname, KEY, '202101.parquet')
+            jan_mtime = os.stat(jan_path).st_mtime_ns
+
+            df2 = _make_df('2021-01-01 00:00:00', 24 * 41)
+            df2.iloc[-1] = -1
+            storage.save(KEY, df2, since=df.index[-1])
+
+            self.assertEqual(os.stat(jan_path).st_mtime_ns, jan_mtime)
+            self.assertEqual(storage.read_manifest(KEY)['partitions']['202102']['count'], 24 * 10)
+            pd.testing.assert_frame_equal(storage.load(KEY), df2)
+
+    def test_version(self):
+        with tempfile.TemporaryDirectory() as dname:
+            storage = PartitionedStorage(dname)
+            self.assertEqual(storage.read_version(KEY), 0)
+            df = _make_df('2021-01-01 00:00:00', 24)
+            self.assertEqual(storage.save(KEY, df), 1)
+            self.assertEqual(storage.save(KEY, df, since=df.index[-1]), 2)
+            self.assertEqual(storage.save(KEY, df), 3)
+            self.assertEqual(PartitionedStorage(dname).read_version(KEY), 3)
+
+    def test_legacy_file(self):
+        with tempfile.TemporaryDirectory() as dname:
+            df = _make_df('2021-01-01 00:00:00', 24)
+            df.to_parquet(os.path.join(dname, KEY + '.parquet'))
+
+            storage = PartitionedStorage(dname)
+            self.assertEqual(storage.keys(), [KEY])
+            pd.testing.assert_frame_equal(storage.load(KEY), df)
+
+            storage.save(KEY, df)
+            self.assertFalse(os.path.exists(os.path.join(dname, KEY + '.parquet')))
+            pd.testing.assert_frame_equal(storage.load(KEY), df)
@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import time
+from unittest import TestCase
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from request_pool import Overloaded, RequestPool
+
+
+class TestRequestPool(TestCase):
+    def test_map_ordered(self):
+        pool = RequestPool(workers=4)
+
+        def work(x):
+            time.sleep(0.01 * (5 - x))
+            return x * 2
+
+        self.assertEqual(list(pool.map_ordered(work, range(5), window=3)), [0, 2, 4, 6, 8])
+        self.assertEqual(pool.status()['queue_depth'], 0)
+
+    def test_admit(self):
+        pool = RequestPool(max_requests=1, max_waiting=1, wait_timeout=0.1)
+        release = pool.admit()
+        self.assertEqual(pool.status()['active'], 1)
+
+        # 1つは待てるが、待ちきれなければOverloaded
+        with self.assertRaises(Overloaded):
+            pool.admit()
+
+        results = []
+        started = threading.Event()
+
+        def wait():
+            started.set()
+            try:
+                results.append(pool.admit())
+            except Overloaded:
+                results.append(None)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        started.wait()
+        time.sleep(0.02)
+        # 待ちが一杯なのですぐOverloaded
+        with self.assertRaises(Overloaded):
+            pool.admit()
+
+        release()
+        release()
+        thread.join()
+        self.assertIsNotNone(results[0])
+        results[0]()
+
+        status = pool.status()
+        self.assertEqual(status['admitted'], 2)
+        self.assertEqual(status['rejected'], 2)
+        self.assertEqual(status['completed'], 2)
+        self.assertEqual(status['active'], 0)
+        self.assertEqual(status['waiting'], 0)
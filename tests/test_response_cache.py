@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+import pyarrow as pa
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from response_cache import ResponseCache, canonical_cache_key
+
+
+class TestResponseCache(TestCase):
+    def test_canonical_cache_key(self):
+        key1 = canonical_cache_key('/ohlcv.parquet', {
+            'exchange': 'ftx',
+            'markets': 'ETH-PERP,BTC-PERP,ETH-PERP',
+            'start_time': '1617289200',
+        })
+        key2 = canonical_cache_key('/ohlcv.parquet', {
+            'start_time': '1617289200.0',
+            'markets': 'BTC-PERP,ETH-PERP',
+            'exchange': 'ftx',
+        })
+        self.assertEqual(key1, key2)
+
+    def test_lru_evict_by_bytes(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.set('a', b'1234')
+        cache.set('b', b'1234')
+        cache.get('a')
+        cache.set('c', b'1234')
+
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'1234')
+
+        # 上限より大きいものはキャッシュしない
+        cache.set('d', b'0' * 11)
+        self.assertIsNone(cache.get('d'))
+
+        status = cache.status()
+        self.assertEqual(status['bytes'], 8)
+        self.assertEqual(status['evictions'], 1)
+        self.assertEqual(status['hits'], 3)
+        self.assertEqual(status['misses'], 2)
+
+    def test_timeout(self):
+        cache = ResponseCache()
+        cache.set('a', b'1', timeout=-1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_disk_shared(self):
+        with tempfile.TemporaryDirectory() as dname:
+            cache1 = ResponseCache(cache_dir=dname)
+            cache2 = ResponseCache(cache_dir=dname)
+            cache1.set('a', b'123')
+
+            self.assertEqual(cache2.get('a'), b'123')
+            self.assertEqual(cache2.status()['disk_hits'], 1)
+            self.assertEqual(cache2.get('a'), b'123')
+            self.assertEqual(cache2.status()['hits'], 1)
+
+            cache1.clear()
+            self.assertIsNone(ResponseCache(cache_dir=dname).get('a'))
+
+    def test_disk_evict(self):
+        with tempfile.TemporaryDirectory() as dname:
+            cache = ResponseCache(cache_dir=dname, max_disk_bytes=30)
+            cache.set('a', b'0' * 10)
+            cache.set('b', b'0' * 10)
+            self.assertEqual(cache.status()['disk_entries'], 1)
+
+    def test_table(self):
+        with tempfile.TemporaryDirectory() as dname:
+            cache = ResponseCache(cache_dir=dname)
+            table = pa.table({'cl': [1.0, 2.0]})
+            cache.set('a', table)
+
+            self.assertIs(cache.get('a'), table)
+            self.assertEqual(cache.status()['bytes'], table.nbytes)
+            # tableはcache_dirに書かない
+            self.assertEqual(cache.status()['disk_entries'], 0)
@@ -0,0 +1,53 @@
+import gzip
+import io
+import os
+import sys
+from unittest import TestCase
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from response_writer import iter_response, resolve_compression
+
+
+def _make_tables():
+    return [pa.table({'cl': [1.0, 2.0]}), pa.table({'cl': [3.0]})]
+
+
+class TestResponseWriter(TestCase):
+    def test_parquet(self):
+        chunks = list(iter_response(iter(_make_tables()), 'parquet', 'zstd'))
+        self.assertEqual(len(chunks), 3)
+
+        f = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(f.metadata.num_row_groups, 2)
+        self.assertEqual(f.metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertEqual(f.read().column('cl').to_pylist(), [1.0, 2.0, 3.0])
+
+    def test_arrow(self):
+        for compression in ['none', 'lz4', 'zstd']:
+            data = b''.join(iter_response(iter(_make_tables()), 'arrow', compression))
+            table = pa.ipc.open_stream(data).read_all()
+            self.assertEqual(table.column('cl').to_pylist(), [1.0, 2.0, 3.0])
+
+    def test_feather(self):
+        data = b''.join(iter_response(iter(_make_tables()), 'feather'))
+        df = pd.read_feather(io.BytesIO(data))
+        self.assertEqual(df['cl'].tolist(), [1.0, 2.0, 3.0])
+
+    def test_csv(self):
+        data = b''.join(iter_response(iter(_make_tables()), 'csv'))
+        df = pd.read_csv(io.BytesIO(gzip.decompress(data)), index_col=0)
+        self.assertEqual(df['cl'].tolist(), [1.0, 2.0, 3.0])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_response(iter([]), 'parquet')), [])
+
+    def test_resolve_compression(self):
+        self.assertEqual(resolve_compression('parquet'), 'snappy')
+        self.assertEqual(resolve_compression('arrow'), 'none')
+        with self.assertRaises(ValueError):
+            resolve_compression('arrow', 'snappy')
+        with self.assertRaises(ValueError):
+            resolve_compression('xlsx')
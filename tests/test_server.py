@@ -5,8 +5,10 @@ import sys
 import time
 from unittest import TestCase
 import pandas as pd
+import pyarrow as pa
 
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+import server
 from server import app, initialize
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,9 @@ class TestServer(TestCase):
         start_time = time.time() - 2 * 24 * 60 * 60
         initialize(start_time=start_time, warmup=False, logger=logger)
 
+    def tearDown(self):
+        server.store.close()
+
     def test_ohlcv(self):
         start_time = time.time() - 2 * 24 * 60 * 60
         end_time = time.time() - 24 * 60 * 60
@@ -112,6 +117,62 @@ class TestServer(TestCase):
 
         self.assertEqual(sorted(df.reset_index()['market'].unique().tolist()), ['BTC-PERP', 'ETH-PERP'])
 
+    def test_ohlcv_stream(self):
+        res = self.app.get('/ohlcv.parquet?exchange=bybit&markets=BTCUSD,ETHUSD&interval=3600&stream=1')
+
+        f = io.BytesIO()
+        f.write(res.data)
+        f.seek(0)
+        df = pd.read_parquet(f)
+
+        self.assertEqual(sorted(df.reset_index()['market'].unique().tolist()), ['BTCUSD', 'ETHUSD'])
+
+        # 書き出し終わったら受け付け枠を返す
+        res.close()
+        self.assertEqual(server.request_pool.status()['active'], 0)
+
+    def test_ohlcv_arrow(self):
+        res = self.app.get('/ohlcv.parquet?exchange=bybit&markets=BTCUSD,ETHUSD&interval=3600&format=arrow')
+        df = pa.ipc.open_stream(res.data).read_pandas()
+
+        self.assertEqual(sorted(df.reset_index()['market'].unique().tolist()), ['BTCUSD', 'ETHUSD'])
+
+    def test_ohlcv_feather(self):
+        res = self.app.get('/ohlcv.feather?exchange=bybit&markets=BTCUSD,ETHUSD&interval=3600&compression=lz4')
+        df = pa.ipc.open_file(res.data).read_pandas()
+
+        self.assertEqual(sorted(df.reset_index()['market'].unique().tolist()), ['BTCUSD', 'ETHUSD'])
+
+    def test_ohlcv_columns(self):
+        res = self.app.get('/ohlcv.parquet?exchange=bybit&markets=BTCUSD,ETHUSD&interval=3600&columns=cl,cl_mark&dtype=float32')
+
+        f = io.BytesIO()
+        f.write(res.data)
+        f.seek(0)
+        df = pd.read_parquet(f)
+
+        self.assertEqual(df.columns.tolist(), ['cl', 'cl_mark'])
+        self.assertEqual(df['cl'].dtype, 'float32')
+
+    def test_ohlcv_wide(self):
+        res = self.app.get('/ohlcv.parquet?exchange=ftx&markets=BTC-PERP,ETH-PERP&interval=3600&columns=cl,fr&layout=wide&ffill_fr=1')
+
+        f = io.BytesIO()
+        f.write(res.data)
+        f.seek(0)
+        df = pd.read_parquet(f)
+
+        self.assertEqual(df.columns.get_level_values('market').unique().tolist(), ['BTC-PERP', 'ETH-PERP'])
+        self.assertTrue(df['fr'].iloc[-1].notna().all())
+
+    def test_gaps(self):
+        res = self.app.get('/gaps?exchange=bybit&market=BTCUSD&interval=3600')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['gaps'], [])
+
+        res = self.app.get('/gaps?exchange=bybit&interval=3600')
+        self.assertEqual(res.status_code, 400)
+
     def test_status_smoke(self):
         res = self.app.get('/status')
         self.assertEqual(res.status, '200 OK')
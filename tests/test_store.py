@@ -2,95 +2,116 @@ import logging
 import os
 import sys
 import tempfile
+import threading
 import time
+import numpy as np
 import pandas as pd
 from unittest import TestCase
 
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
-from store import Store
+from partitioned_storage import PartitionedStorage
+from store import Store, _calc_bybit_fr, _fr_key, _ohlcv_key, _parse_ohlcv_key
+
+
+def _make_df_ohlcv(start, periods, interval):
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=periods, freq=pd.to_timedelta(interval, unit='s'), tz='UTC'),
+        'op': np.arange(periods, dtype=float),
+        'hi': np.arange(periods, dtype=float) + 10,
+        'lo': np.arange(periods, dtype=float) - 10,
+        'cl': np.arange(periods, dtype=float) + 1,
+        'volume': np.ones(periods),
+    })
+    return df.set_index('timestamp')
+
 
 class TestStore(TestCase):
+    def _store(self, **kwargs):
+        store = Store(**kwargs)
+        self.addCleanup(store.close)
+        return store
+
     def test_get_df_ohlcv_bybit(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_ohlcv_ftx(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='ftx', market='BTC-PERP', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_ohlcv_binance_future(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='binance_future', market='BTCUSDT', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_ohlcv_binance_spot(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='binance_spot', market='BTCUSDT', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_ohlcv_okex(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='okex', market='BTC-USDT-SWAP', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_ohlcv_kraken(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_ohlcv(exchange='kraken', market='XXBTZUSD', interval=60 * 60, price_type=None)
         self.assertEqual(df.shape[0], 23)
 
     def test_get_df_fr_bybit(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 32 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 32 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='bybit', market='BTCUSD')
         self.assertEqual(df.shape[0], 3)
 
     def test_get_df_fr_bybit_inverse_futures(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 32 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 32 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='bybit', market='BTCUSDU21')
         self.assertIsNone(df)
 
     def test_get_df_fr_ftx(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='ftx', market='BTC-PERP')
         self.assertEqual(df.shape[0], 24)
 
     def test_get_df_fr_ftx_future(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='ftx', market='BTC-20201225')
         self.assertIsNone(df)
 
     def test_get_df_fr_binance_future(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='binance_future', market='BTCUSDT')
         self.assertIsNone(df)
 
     def test_get_df_fr_binance_spot(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='binance_spot', market='BTCUSDT')
         self.assertIsNone(df)
 
     def test_get_df_fr_okex(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         df = store.get_df_fr(exchange='okex', market='BTC-USDT-SWAP')
         self.assertIsNone(df)
 
     def test_status(self):
         logger = logging.getLogger(__name__)
-        store = Store(start_time=time.time() - 24 * 60 * 60, logger=logger)
+        store = self._store(start_time=time.time() - 24 * 60 * 60, logger=logger)
         store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60 * 60, price_type=None)
         status = store.status()
         print(status)
@@ -99,11 +120,399 @@ class TestStore(TestCase):
     def test_data_dir(self):
         logger = logging.getLogger(__name__)
         with tempfile.TemporaryDirectory() as dname:
-            store = Store(
+            store = self._store(
                 start_time=time.time() - 24 * 60 * 60,
                 data_dir=dname,
                 logger=logger,
+                min_interval=60 * 60,
             )
             store.get_df_ohlcv(exchange='ftx', market='BTC-PERP', interval=60 * 60, price_type=None)
-            df = pd.read_parquet(os.path.join(dname, 'ohlcv,exchange=ftx,market=BTC-PERP,interval=3600,price_type=None.parquet'))
+            df = PartitionedStorage(dname).load('ohlcv,exchange=ftx,market=BTC-PERP,interval=3600,price_type=None')
             self.assertEqual(df.shape[0], 23)
+
+    def test_get_ohlcv_fetch_interval(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        self.assertEqual(store.get_ohlcv_fetch_interval(15), 15)
+        self.assertEqual(store.get_ohlcv_fetch_interval(60), 60)
+        self.assertEqual(store.get_ohlcv_fetch_interval(3600), 60)
+        self.assertEqual(store.get_ohlcv_fetch_interval(86400), 60)
+        self.assertEqual(store.get_ohlcv_fetch_interval(7 * 86400), 7 * 86400)
+
+        store = self._store(logger=logger, min_interval=3600)
+        self.assertEqual(store.get_ohlcv_fetch_interval(60), 60)
+        self.assertEqual(store.get_ohlcv_fetch_interval(4 * 3600), 3600)
+
+    def test_get_df_ohlcv_resampled(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        # 00:00:00 - 01:04:00
+        store.dfs[_ohlcv_key('bybit', 'BTCUSD', 60, None)] = _make_df_ohlcv('2021-01-01 00:00:00', 65, 60)
+
+        df = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=300, price_type=None)
+        self.assertEqual(df.shape[0], 13)
+        self.assertEqual(df['op'].iloc[1], 5)
+        self.assertEqual(df['hi'].iloc[1], 19)
+        self.assertEqual(df['lo'].iloc[1], -5)
+        self.assertEqual(df['cl'].iloc[1], 10)
+        self.assertEqual(df['volume'].iloc[1], 5)
+
+        df = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=3600, price_type=None)
+        self.assertEqual(df.shape[0], 1)
+        self.assertEqual(df.index[0], pd.to_datetime('2021-01-01 00:00:00', utc=True))
+
+    def test_get_df_ohlcv_resampled_cache(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        store.dfs[key] = _make_df_ohlcv('2021-01-01 00:00:00', 60, 60)
+        store.versions[key] += 1
+
+        store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=300, price_type=None)
+        cached = store.resampled_dfs[_ohlcv_key('bybit', 'BTCUSD', 300, None)]
+        store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=300, price_type=None)
+        self.assertIs(store.resampled_dfs[_ohlcv_key('bybit', 'BTCUSD', 300, None)], cached)
+
+    def test_get_df_fr_bybit_incremental(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            store = self._store(logger=logger, data_dir=dname)
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, 'premium_index')
+            df_pi = _make_df_ohlcv('2021-01-01 03:00:00', 4 * 24 * 60, 60)
+            df_pi['cl'] = np.sin(np.arange(df_pi.shape[0]) / 100.0) * 0.001
+
+            store.dfs[key] = df_pi.iloc[:2000]
+            store.versions[key] += 1
+            df = store.get_df_fr(exchange='bybit', market='BTCUSD')
+            pd.testing.assert_frame_equal(df, _calc_bybit_fr(df_pi.iloc[:2000]), check_index_type=False)
+            version = store.get_version(_fr_key('bybit', 'BTCUSD'))
+
+            # premium_indexが変わらなければ計算し直さない
+            self.assertIs(store.get_df_fr(exchange='bybit', market='BTCUSD'), df)
+
+            # frを作った後は、frのリクエストでpremium_indexを読まない
+            store.dfs[key] = df_pi
+            store.versions[key] += 1
+            self.assertIs(store.get_df_fr(exchange='bybit', market='BTCUSD'), df)
+
+            # premium_indexを更新したとき(warmup)にfrも更新される
+            store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type='premium_index')
+            df = store.get_df_fr(exchange='bybit', market='BTCUSD')
+            pd.testing.assert_frame_equal(df, _calc_bybit_fr(df_pi), check_index_type=False)
+            self.assertGreater(store.get_version(_fr_key('bybit', 'BTCUSD')), version)
+            pd.testing.assert_frame_equal(PartitionedStorage(dname).load(_fr_key('bybit', 'BTCUSD')), df, check_freq=False, check_index_type=False)
+
+            # 保存済みのfrはpremium_indexを読まずに返す
+            store2 = self._store(logger=logger, data_dir=dname)
+            df2 = store2.get_df_fr(exchange='bybit', market='BTCUSD')
+            pd.testing.assert_frame_equal(df2, df, check_freq=False, check_index_type=False)
+            self.assertNotIn(key, store2.dfs)
+
+    def test_compress_cold(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger, cold_after_sec=60)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        df_src = _make_df_ohlcv('2021-01-01 00:00:00', 1000, 60)
+        calls = []
+
+        def fetch(df):
+            calls.append(df)
+            return df_src
+
+        store._get_df(key, fetch)
+        store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=300, price_type=None)
+        store.compress_cold(now=time.time() + 30)
+        self.assertEqual(store.status()['memory']['cold_count'], 0)
+
+        store.compress_cold(now=time.time() + 60)
+        status = store.status()
+        self.assertNotIn(key, store.dfs)
+        self.assertEqual(store.resampled_dfs, {})
+        self.assertEqual(status['memory']['cold_count'], 1)
+        self.assertEqual(status['memory']['hot_bytes'], 0)
+        self.assertEqual(status['dfs'][key]['count'], 1000)
+        self.assertTrue(status['dfs'][key]['cold'])
+
+        # 取得し直さずに戻す
+        df, _ = store._get_df(key, fetch)
+        self.assertEqual(len(calls), 1)
+        pd.testing.assert_frame_equal(df, df_src, check_freq=False, check_index_type=False)
+        self.assertEqual(store.status()['memory']['cold_count'], 0)
+
+    def test_close(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger, cold_after_sec=60)
+        store.close()
+        self.assertFalse(store.cold_thread.is_alive())
+        self.assertFalse(store.fetch_loop.thread.is_alive())
+        store.close()
+
+    def test_backfill(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            store = self._store(logger=logger, data_dir=dname)
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            df_full = _make_df_ohlcv('2021-01-31 23:00:00', 180, 60)
+            # 2021-02-01 00:00:00 - 00:29:00 と 01:00:00 - 01:09:00 が欠けている
+            df_src = df_full.drop(df_full.index[60:90]).drop(df_full.index[120:130])
+            store._get_df(key, lambda df: df_src)
+
+            gaps = store.get_gaps('bybit', 'BTCUSD', 60, None)
+            start = int(df_full.index[60].timestamp())
+            self.assertEqual(gaps, [(start, start + 30 * 60, 30), (start + 60 * 60, start + 70 * 60, 10)])
+            self.assertEqual(store.get_gaps('bybit', 'BTCUSD', 300, None), gaps)
+            self.assertEqual(len(store.get_gaps('bybit', 'BTCUSD', 60, None, min_gap_bars=11)), 1)
+
+            # 最初の穴の手前から取得し直す。2つ目の穴は取引所にもデータがない
+            calls = []
+
+            def fetch(df):
+                calls.append(df)
+                return pd.concat([df, df_full[df_full.index > df.index[-1]].drop(df_full.index[120:130])])
+
+            store._ohlcv_fetch = lambda exchange, market, interval, price_type: fetch
+            filled = store.backfill('bybit', 'BTCUSD', 60, None)
+            self.assertEqual(filled, [gaps[0]])
+            self.assertEqual(calls[0].index[-1], df_full.index[59])
+            df, _ = store._get_df(key, fetch)
+            self.assertEqual(df.shape[0], 170)
+
+            self.assertEqual(store.get_gaps('bybit', 'BTCUSD', 60, None), [])
+            self.assertEqual(store.backfill('bybit', 'BTCUSD', 60, None), [])
+            self.assertEqual(len(calls), 1)
+
+            # 保存したものを読んでも同じ
+            store2 = self._store(logger=logger, data_dir=dname)
+            self.assertEqual(store2.get_range(key).shape[0], 170)
+            self.assertEqual(store2.get_gaps('bybit', 'BTCUSD', 60, None), [])
+
+    def test_backfill_min_gap_time(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        df_full = _make_df_ohlcv('2021-01-31 23:00:00', 180, 60)
+        df_src = df_full.drop(df_full.index[60:90]).drop(df_full.index[120:130])
+        store._get_df(key, lambda df: df_src)
+        gaps = store.get_gaps('bybit', 'BTCUSD', 60, None)
+        calls = []
+
+        def fetch(df):
+            calls.append(df)
+            return pd.concat([df, df_full[df_full.index > df.index[-1]]])
+
+        # 古い穴は無視し、新しい穴の手前から取得し直す
+        store._ohlcv_fetch = lambda exchange, market, interval, price_type: fetch
+        filled = store.backfill('bybit', 'BTCUSD', 60, None, min_gap_time=gaps[1][0])
+        self.assertEqual(filled, [gaps[1]])
+        self.assertEqual(calls[0].index[-1], df_full.index[119])
+        self.assertEqual(store.get_gaps('bybit', 'BTCUSD', 60, None), [gaps[0]])
+        self.assertEqual(store.confirmed_gaps, {})
+
+    def test_parse_ohlcv_key(self):
+        self.assertEqual(_parse_ohlcv_key(_ohlcv_key('bybit', 'BTCUSD', 60, None)), ('bybit', 'BTCUSD', 60, None))
+        self.assertEqual(_parse_ohlcv_key(_ohlcv_key('ftx', 'BTC-PERP', 300, 'index')), ('ftx', 'BTC-PERP', 300, 'index'))
+        self.assertIsNone(_parse_ohlcv_key(_fr_key('ftx', 'BTC-PERP')))
+
+    def test_snapshot_not_modified(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        df_src = _make_df_ohlcv('2021-01-01 00:00:00', 10, 60)
+        df1, _ = store._get_df(key, lambda df: df_src)
+
+        # 最後の足が更新され、1本追記される
+        df_src2 = pd.concat([df_src.iloc[:-1], _make_df_ohlcv('2021-01-01 00:09:00', 2, 60) + 50])
+        df2, _ = store._get_df(key, lambda df: df_src2, force_fetch=True)
+        self.assertEqual(df1['op'].tolist(), list(range(10)))
+        self.assertEqual(df2['op'].tolist()[-3:], [8, 50, 51])
+
+        df_src3 = pd.concat([df_src2.iloc[:-1], _make_df_ohlcv('2021-01-01 00:10:00', 1, 60) + 100])
+        df3, _ = store._get_df(key, lambda df: df_src3, force_fetch=True)
+        self.assertEqual(df2['op'].tolist()[-2:], [50, 51])
+        self.assertEqual(df3['op'].tolist()[-2:], [50, 100])
+
+    def test_read_only_reload_snapshot(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            storage = PartitionedStorage(dname)
+            df_src = _make_df_ohlcv('2021-01-01 00:00:00', 10, 60)
+            storage.save(key, df_src)
+            store = self._store(logger=logger, data_dir=dname, read_only=True, version_check_interval=0)
+            df1, _ = store._get_df(key, None)
+
+            df_src2 = df_src.copy()
+            df_src2.iloc[-1] += 50
+            storage.save(key, df_src2)
+            df2, _ = store._get_df(key, None)
+            self.assertEqual(df1['op'].iloc[-1], 9)
+            self.assertEqual(df2['op'].iloc[-1], 59)
+
+    def test_data_dir_load(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            PartitionedStorage(dname).save(key, _make_df_ohlcv('2021-01-31 23:00:00', 120, 60))
+
+            store = self._store(data_dir=dname, logger=logger)
+            df = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type=None)
+            self.assertEqual(df.shape[0], 120)
+
+    def test_data_dir_lazy_load_and_evict(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            storage = PartitionedStorage(dname)
+            key1 = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            key2 = _ohlcv_key('bybit', 'ETHUSD', 60, None)
+            storage.save(key1, _make_df_ohlcv('2021-01-01 00:00:00', 1000, 60))
+            storage.save(key2, _make_df_ohlcv('2021-01-01 00:00:00', 1000, 60))
+
+            store = self._store(data_dir=dname, logger=logger, memory_limit=1000 * 6 * 8 * 1.5)
+            self.assertEqual(store.dfs, {})
+            self.assertEqual(store.status()['dfs'][key1]['count'], 1000)
+            self.assertFalse(store.status()['dfs'][key1]['resident'])
+
+            store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type=None)
+            self.assertEqual(list(store.dfs.keys()), [key1])
+
+            df = store.get_df_ohlcv(exchange='bybit', market='ETHUSD', interval=60, price_type=None)
+            self.assertEqual(df.shape[0], 1000)
+            self.assertEqual(list(store.dfs.keys()), [key2])
+
+    def test_get_df_ohlcv_reader_not_blocked_by_fetch(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        df = _make_df_ohlcv('2021-01-01 00:00:00', 60, 60)
+        store.dfs[key] = df
+
+        with store._get_lock(key):
+            df2 = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type=None)
+        self.assertEqual(df2.shape[0], 60)
+
+    def test_get_df_coalesce_cold_fetch(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        calls = []
+
+        def fetch(df):
+            calls.append(df)
+            time.sleep(0.1)
+            return _make_df_ohlcv('2021-01-01 00:00:00', 60, 60)
+
+        threads = [threading.Thread(target=store._get_df, args=(key, fetch)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(store.versions[key], 1)
+
+    def test_get_range(self):
+        logger = logging.getLogger(__name__)
+        store = self._store(logger=logger)
+        key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+        store.dfs[key] = _make_df_ohlcv('2021-01-01 00:00:00', 60, 60)
+
+        start_time = pd.to_datetime('2021-01-01 00:10:00', utc=True).timestamp()
+        end_time = pd.to_datetime('2021-01-01 00:20:00', utc=True).timestamp()
+        df = store.get_range(key, start_time=start_time, end_time=end_time)
+        self.assertEqual(df.shape[0], 10)
+        self.assertEqual(df.index[0], pd.to_datetime('2021-01-01 00:10:00', utc=True))
+
+        df = store.get_range(key, start_time=end_time, end_time=start_time)
+        self.assertEqual(df.shape[0], 0)
+
+        self.assertIsNone(store.get_range(_ohlcv_key('bybit', 'ETHUSD', 60, None)))
+
+        df = store.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=300, price_type=None,
+                                start_time=start_time, end_time=end_time)
+        self.assertEqual(df.shape[0], 2)
+
+    def test_get_version(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            store = self._store(data_dir=dname, logger=logger)
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            calls = []
+
+            def fetch(df):
+                calls.append(df)
+                return _make_df_ohlcv('2021-01-01 00:00:00', 60 + len(calls), 60)
+
+            self.assertEqual(store.get_version(key), 0)
+            store._get_df(key, fetch, force_fetch=True)
+            store._get_df(key, fetch, force_fetch=True)
+            self.assertEqual(store.get_version(key), 2)
+
+            # 同じdata_dirを読む別のstoreでも同じversion
+            store2 = self._store(data_dir=dname, logger=logger)
+            self.assertEqual(store2.get_version(key), 2)
+            store2.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type=None)
+            self.assertEqual(store2.get_version(key), 2)
+
+            self.assertEqual(store.get_ohlcv_source_key('bybit', 'BTCUSD', 300, None), key)
+            self.assertEqual(store.get_fr_source_key('bybit', 'BTCUSD'), _fr_key('bybit', 'BTCUSD'))
+            self.assertIsNone(store.get_fr_source_key('binance_future', 'BTC/USDT'))
+
+    def test_read_only(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            store = self._store(data_dir=dname, logger=logger)
+            reader = self._store(data_dir=dname, logger=logger, read_only=True, version_check_interval=0)
+            key = _ohlcv_key('bybit', 'BTCUSD', 60, None)
+            calls = []
+
+            def fetch(df):
+                calls.append(df)
+                return _make_df_ohlcv('2021-01-01 00:00:00', 60 + len(calls), 60)
+
+            df, version = reader._get_df(key, fetch)
+            self.assertIsNone(df)
+            self.assertEqual(version, 0)
+
+            store._get_df(key, fetch, force_fetch=True)
+            df, version = reader._get_df(key, fetch, force_fetch=True)
+            self.assertEqual(df.shape[0], 61)
+            self.assertEqual(version, 1)
+
+            store._get_df(key, fetch, force_fetch=True)
+            df = reader.get_df_ohlcv(exchange='bybit', market='BTCUSD', interval=60, price_type=None)
+            self.assertEqual(df.shape[0], 62)
+            self.assertEqual(reader.get_version(key), 2)
+            # readerは取得しない
+            self.assertEqual(len(calls), 2)
+
+    def test_sealed(self):
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dname:
+            store = self._store(data_dir=dname, logger=logger)
+            key = _ohlcv_key('ftx', 'BTC-20210326', 60, None)
+            calls = []
+
+            def fetch(df):
+                calls.append(df)
+                return _make_df_ohlcv('2021-01-01 00:00:00', 60 + len(calls), 60)
+
+            store._get_df(key, fetch, force_fetch=True, exchange='ftx', market='BTC-20210326')
+            store.seal_market('ftx', 'BTC-20210326')
+            self.assertFalse(store.is_final(key))
+
+            # seal後の最初の取得が最後
+            store._get_df(key, fetch, force_fetch=True, exchange='ftx', market='BTC-20210326')
+            self.assertTrue(store.is_final(key))
+            df, _ = store._get_df(key, fetch, force_fetch=True, exchange='ftx', market='BTC-20210326')
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(df.shape[0], 62)
+
+            store = self._store(data_dir=dname, logger=logger)
+            self.assertTrue(store.is_sealed('ftx', 'BTC-20210326'))
+            self.assertTrue(store.is_final(key))
+            df, _ = store._get_df(key, fetch, force_fetch=True, exchange='ftx', market='BTC-20210326')
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(df.shape[0], 62)
+
+            store.set_sealed('ftx', 'BTC-20210326', False)
+            self.assertFalse(store.is_final(key))
@@ -20,5 +20,7 @@ class TestStoreWarpupBinanceSpot(TestCase):
         logger.addHandler(handler)
 
         store = Store(start_time=time.time() - 2 * 24 * 60 * 60, logger=logger)
+
+        self.addCleanup(store.close)
         warmup = StoreWarpupBinanceSpot(store=store, logger=logger)
         warmup._loop(raise_error=True)
@@ -20,5 +20,7 @@ class TestStoreWarpupBybit(TestCase):
         logger.addHandler(handler)
 
         store = Store(start_time=time.time() - 2 * 24 * 60 * 60, logger=logger)
+
+        self.addCleanup(store.close)
         warmup = StoreWarpupBybit(store=store, logger=logger)
         warmup._loop(raise_error=True)
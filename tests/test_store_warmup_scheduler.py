@@ -0,0 +1,146 @@
+import logging
+import os
+import sys
+import threading
+import time
+from unittest import TestCase
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../src")
+from access_tracker import AccessTracker
+from store_warmup_scheduler import StoreWarmupScheduler, WarmupPolicy, WarmupTask
+
+
+class _DummyStore:
+    def __init__(self, fail_markets=(), final_markets=()):
+        self.fail_markets = fail_markets
+        self.final_markets = final_markets
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_df_ohlcv(self, exchange=None, market=None, interval=None, price_type=None, force_fetch=False):
+        with self.lock:
+            self.calls.append(market)
+        if market in self.fail_markets:
+            raise Exception('fail')
+
+    def is_final(self, key):
+        return any('market={},'.format(x) in key for x in self.final_markets)
+
+
+class _DummyWarmup:
+    exchange = 'bybit'
+
+    def __init__(self, markets):
+        self.markets = markets
+
+    def list_tasks(self):
+        return [WarmupTask(exchange=self.exchange, market=x, interval=60) for x in self.markets]
+
+
+class TestStoreWarmupScheduler(TestCase):
+    def test_task_key(self):
+        task = WarmupTask(exchange='bybit', market='BTCUSD', interval=60, price_type='mark')
+        self.assertEqual(task.key, 'ohlcv,exchange=bybit,market=BTCUSD,interval=60,price_type=mark')
+        task = WarmupTask(exchange='ftx', market='BTC-PERP', fr=True)
+        self.assertEqual(task.key, 'fr,exchange=ftx,market=BTC-PERP')
+
+    def test_run(self):
+        logger = logging.getLogger(__name__)
+        store = _DummyStore(fail_markets=['C'], final_markets=['D'])
+        scheduler = StoreWarmupScheduler(
+            store=store,
+            logger=logger,
+            warmups=[_DummyWarmup(['A', 'B', 'C', 'D'])],
+            workers=2,
+            refresh_interval=0.2,
+            backoff_base=10,
+        )
+        scheduler.start()
+        try:
+            time.sleep(1)
+            status = scheduler.status()['bybit']
+        finally:
+            scheduler.stop()
+
+        self.assertGreater(store.calls.count('A'), 1)
+        self.assertGreater(store.calls.count('B'), 1)
+        # 失敗したキーはbackoffで間隔を空ける
+        self.assertEqual(store.calls.count('C'), 1)
+        self.assertEqual(store.calls.count('D'), 1)
+        self.assertEqual(status['tasks'], 4)
+        self.assertEqual(status['failing'], 1)
+        self.assertEqual(status['final'], 1)
+        self.assertIsNotNone(status['last_cycle_sec'])
+
+    def test_unseal(self):
+        logger = logging.getLogger(__name__)
+        store = _DummyStore(final_markets=['D'])
+        warmup = _DummyWarmup(['A', 'D'])
+        scheduler = StoreWarmupScheduler(
+            store=store,
+            logger=logger,
+            warmups=[warmup],
+            workers=2,
+            refresh_interval=0.1,
+        )
+        scheduler.start()
+        try:
+            time.sleep(0.5)
+            status = scheduler.status()['bybit']
+            # finalなキーは1周に含めない
+            time.sleep(0.5)
+            status2 = scheduler.status()['bybit']
+            self.assertEqual(store.calls.count('D'), 1)
+
+            store.final_markets = []
+            scheduler.update_tasks('bybit', warmup.list_tasks())
+            time.sleep(0.5)
+            status3 = scheduler.status()['bybit']
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(status['final'], 1)
+        self.assertNotEqual(status['last_cycle_sec'], status2['last_cycle_sec'])
+        self.assertGreater(store.calls.count('D'), 2)
+        self.assertEqual(status3['final'], 0)
+
+    def test_policy(self):
+        tracker = AccessTracker()
+        policy = WarmupPolicy(
+            access_tracker=tracker,
+            hot_refresh_sec=60,
+            cold_refresh_sec=3600,
+            hot_window_sec=600,
+            idle_expiry_sec=86400,
+        )
+        task = WarmupTask(exchange='bybit', market='BTCUSD', interval=60)
+        self.assertIsNone(policy.refresh_interval(task, 1000))
+
+        tracker.record('bybit', 'BTCUSD', now=1000)
+        self.assertEqual(policy.refresh_interval(task, 1000), 60)
+        self.assertEqual(policy.refresh_interval(task, 1000 + 601), 3600)
+        self.assertIsNone(policy.refresh_interval(task, 1000 + 86401))
+
+    def test_run_demand(self):
+        logger = logging.getLogger(__name__)
+        tracker = AccessTracker()
+        tracker.record('bybit', 'A')
+        store = _DummyStore()
+        scheduler = StoreWarmupScheduler(
+            store=store,
+            logger=logger,
+            warmups=[_DummyWarmup(['A', 'B'])],
+            policy=WarmupPolicy(access_tracker=tracker, hot_refresh_sec=0.2, idle_expiry_sec=60),
+        )
+        scheduler.start()
+        try:
+            time.sleep(1)
+            status = scheduler.status()['bybit']
+        finally:
+            scheduler.stop()
+
+        self.assertGreater(store.calls.count('A'), 1)
+        self.assertEqual(store.calls.count('B'), 0)
+        self.assertEqual(status['idle'], 1)
+        # 更新しないキーを待たずに1周する
+        self.assertIsNotNone(status['last_cycle_sec'])